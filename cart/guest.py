@@ -0,0 +1,39 @@
+"""Carts of anonymous users, kept in a signed cookie.
+
+The cookie holds ``{product_id: quantity}`` signed with SECRET_KEY, so a
+guest cart costs no database writes; reading it loads the products only.
+``merge_guest_cart`` folds it into the user's cart once they obtain a token.
+"""
+from django.conf import settings
+from django.core import signing
+
+SALT = "cart.guest"
+
+
+def read_guest_cart(request):
+    """Return the request's guest cart, empty when missing or tampered with."""
+    value = request.COOKIES.get(settings.GUEST_CART_COOKIE)
+    if not value:
+        return {}
+    try:
+        lines = signing.loads(value, salt=SALT, max_age=settings.GUEST_CART_MAX_AGE)
+        return {int(pid): int(qty) for pid, qty in lines.items() if int(qty) > 0}
+    except (signing.BadSignature, AttributeError, TypeError, ValueError):
+        return {}
+
+
+def write_guest_cart(response, lines):
+    if not lines:
+        clear_guest_cart(response)
+        return
+    response.set_cookie(
+        settings.GUEST_CART_COOKIE,
+        signing.dumps(lines, salt=SALT, compress=True),
+        max_age=settings.GUEST_CART_MAX_AGE,
+        httponly=True,
+        samesite="Lax",
+    )
+
+
+def clear_guest_cart(response):
+    response.delete_cookie(settings.GUEST_CART_COOKIE, samesite="Lax")
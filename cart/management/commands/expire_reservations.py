@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from cart.models import StockReservation
+
+
+class Command(BaseCommand):
+    help = "Return the stock of cart reservations older than STOCK_RESERVATION_TTL."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        expired = sum(StockReservation.objects.expire(batch_size=options["batch_size"]))
+        self.stdout.write(f"Expired {expired} stock reservations.")
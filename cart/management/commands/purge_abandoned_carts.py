@@ -0,0 +1,31 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from cart.services import purge_abandoned_carts
+
+
+class Command(BaseCommand):
+    help = "Delete carts that have not been touched for --days days, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=30)
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Old cart lines to look at per transaction.",
+        )
+        parser.add_argument(
+            "--sleep", type=float, default=0.5,
+            help="Seconds to wait between batches, to let replicas catch up.",
+        )
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options["days"])
+        purged = 0
+        for count in purge_abandoned_carts(before, batch_size=options["batch_size"]):
+            purged += count
+            self.stdout.write(f"Deleted a batch of {count} carts.")
+            time.sleep(options["sleep"])
+        self.stdout.write(f"Deleted {purged} abandoned carts.")
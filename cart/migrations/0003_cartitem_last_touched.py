@@ -0,0 +1,19 @@
+# Generated by Django 4.2 on 2026-10-17 00:56
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0002_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartitem',
+            name='last_touched',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
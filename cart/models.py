@@ -1,49 +1,211 @@
-from django.db import models, transaction
+from django.conf import settings
+from django.db import connection, models, transaction
 from django.forms import ValidationError
+from django.utils import timezone
 
-from products.models import Product
+from products.inventory import available_stock, return_stock, take_stock
+from products.models import Product, StockShard
+from store.identity import current_identity_map
+from store.transactions import retry_on_conflict
 from users.models import User
 
 
+def _available_stock_sql(product):
+    # Sharded products keep Product.stock at 0, so the sum covers both layouts.
+    return (
+        f"{product}.stock + COALESCE((SELECT SUM(shard.stock)"
+        f" FROM {StockShard._meta.db_table} shard"
+        f" WHERE shard.product_id = {product}.id), 0)"
+    )
+
+
+def changed_lines(current, entries):
+    """Return the lines of ``current`` ({product_id: quantity}) that the
+    ``{product_id, quantity, op}`` entries change; 0 means removed."""
+    wanted = dict(current)
+    for entry in entries:
+        pid = entry["product_id"]
+        if entry["op"] == "add":
+            wanted[pid] = wanted.get(pid, 0) + entry["quantity"]
+        elif entry["op"] == "set":
+            wanted[pid] = entry["quantity"]
+        else:
+            wanted[pid] = 0
+    return {pid: qty for pid, qty in wanted.items() if qty != current.get(pid, 0)}
+
+
+def check_changed_lines(user, changed, products):
+    if settings.STOCK_RESERVATIONS:
+        for pid in sorted(changed):
+            if changed[pid]:
+                StockReservation.objects.hold(user, products[pid], changed[pid])
+            else:
+                StockReservation.objects.release(user, pid)
+        return
+    # The products were loaded while validating the request; check the
+    # quantities that grow against the rows as they are once locked.
+    wanted = {pid: qty for pid, qty in changed.items() if qty}
+    locked = current_identity_map().lock(Product, wanted.keys())
+    check_available_stock(wanted, {**products, **locked})
+
+
+def check_available_stock(changed, products):
+    shortfalls = [
+        {"product_id": pid, "requested": qty, "available": available_stock(products[pid])}
+        for pid, qty in sorted(changed.items())
+        if qty > available_stock(products[pid])
+    ]
+    if shortfalls:
+        raise ValidationError("Not enough stock.", params={"products": shortfalls})
+
+
 # Create your models here.
 class CartItemManager(models.Manager):
-    @transaction.atomic
-    def add(self, user, product_id, quantity):
-        product = Product.objects.select_for_update().get(pk=product_id)
-        item, created = self.select_for_update().get_or_create(user=user, product=product)
+    def _upsert_sql(self, increment):
+        cart = self.model._meta.db_table
+        products = Product._meta.db_table
+        new_quantity = (
+            f"{cart}.quantity + EXCLUDED.quantity" if increment else "EXCLUDED.quantity"
+        )
+        return f"""
+            INSERT INTO {cart} (user_id, product_id, quantity, last_touched)
+            SELECT %s, product.id, %s, %s FROM {products} product
+            WHERE product.id = %s AND {_available_stock_sql("product")} >= %s
+            ON CONFLICT (user_id, product_id) DO UPDATE
+            SET quantity = {new_quantity}, last_touched = EXCLUDED.last_touched
+            WHERE {new_quantity} <= (
+                SELECT {_available_stock_sql("product")}
+                FROM {products} product WHERE product.id = EXCLUDED.product_id
+            )
+            RETURNING id, quantity
+        """
 
-        if quantity <= 0:
-            raise ValidationError("Quantity must be positive.")
-        if created:
-            quantity -= 1
-        new_amount = item.quantity + quantity
-        if new_amount > product.stock:
+    @retry_on_conflict
+    def _upsert(self, user, product_id, quantity, product, increment):
+        """Write the cart line with one INSERT ... ON CONFLICT DO UPDATE that
+        only succeeds while stock covers the resulting quantity, so no
+        product row is locked."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                self._upsert_sql(increment),
+                [user.pk, quantity, timezone.now(), product_id, quantity],
+            )
+            row = cursor.fetchone()
+        if row is None:
+            if product is None and not Product.objects.filter(pk=product_id).exists():
+                raise ValidationError("No such product.")
             raise ValidationError("Not enough stock.")
-        item.quantity = new_amount
 
-        item.save()
+        item = self.model(id=row[0], user=user, product_id=product_id, quantity=row[1])
+        item.product = product or current_identity_map().get(Product, product_id)
         return item
 
+    @retry_on_conflict
     @transaction.atomic
-    def update(self, user, product_id, quantity):
-        product = Product.objects.select_for_update().get(pk=product_id)
-        item, _ = self.select_for_update().get_or_create(user=user, product=product)
+    def _set_reserved(self, user, product_id, quantity, increment):
+        # The cart line is locked before hold() touches the reservation and
+        # the product, the order of store/transactions.py.
+        product = current_identity_map().get(Product, product_id)
+        item, created = self.select_for_update().get_or_create(
+            user=user, product=product, defaults={"quantity": 0}
+        )
+        new_amount = item.quantity + quantity if increment else quantity
+        StockReservation.objects.hold(user, product, new_amount)
+        item.quantity = new_amount
+        item.last_touched = timezone.now()
+        item.save(update_fields=["quantity", "last_touched"])
+        return item
+
+    def _write(self, user_id, changed):
+        removed = [pid for pid, qty in changed.items() if not qty]
+        if removed:
+            self.filter(user_id=user_id, product_id__in=removed).delete()
+        now = timezone.now()
+        self.bulk_create(
+            [
+                self.model(user_id=user_id, product_id=pid, quantity=qty, last_touched=now)
+                for pid, qty in changed.items()
+                if qty
+            ],
+            update_conflicts=True,
+            unique_fields=["user", "product"],
+            update_fields=["quantity", "last_touched"],
+        )
 
+    @transaction.atomic
+    def apply(self, user, entries, products):
+        """Apply ``{product_id, quantity, op}`` entries to the user's cart in
+        one transaction; ``products`` maps their product ids to products."""
+        current = dict(
+            self.select_for_update()
+            .filter(user=user, product_id__in=products.keys())
+            .values_list("product_id", "quantity")
+        )
+        changed = changed_lines(current, entries)
+        check_changed_lines(user, changed, products)
+        self._write(user.pk, changed)
+
+    @transaction.atomic
+    def replace(self, user_id, lines):
+        """Make the user's cart rows match ``{product_id: quantity}``."""
+        self.filter(user_id=user_id).exclude(product_id__in=lines.keys()).delete()
+        self._write(user_id, lines)
+
+    def add(self, user, product_id, quantity, product=None):
+        """Add ``quantity`` to the user's cart line; ``product``, when the
+        caller already loaded it, saves a query for the response."""
         if quantity <= 0:
             raise ValidationError("Quantity must be positive.")
+        if settings.STOCK_RESERVATIONS:
+            return self._set_reserved(user, product_id, quantity, increment=True)
+        return self._upsert(user, product_id, quantity, product, increment=True)
 
-        if quantity > product.stock:
-            raise ValidationError("Not enough stock.")
-        item.quantity = quantity
+    def update(self, user, product_id, quantity, product=None):
+        if quantity <= 0:
+            raise ValidationError("Quantity must be positive.")
+        if settings.STOCK_RESERVATIONS:
+            return self._set_reserved(user, product_id, quantity, increment=False)
+        return self._upsert(user, product_id, quantity, product, increment=False)
 
-        item.save(update_fields=["quantity"])
-        return item
+    def purge_abandoned(self, before, batch_size=1000):
+        """Delete the carts of users who have not touched any line since
+        ``before``, yielding the user ids of each batch.
+
+        Users are walked in id order from a keyset cursor. A batch looks at
+        about ``batch_size`` old lines and deletes whole carts, releasing
+        their stock reservations in the same transaction."""
+        last_user_id = 0
+        while True:
+            with transaction.atomic():
+                candidates = set(
+                    self.filter(user_id__gt=last_user_id, last_touched__lt=before)
+                    .order_by("user_id")
+                    .values_list("user_id", flat=True)[:batch_size]
+                )
+                if not candidates:
+                    return
+                last_user_id = max(candidates)
+                lines = list(
+                    self.select_for_update()
+                    .filter(user_id__in=candidates)
+                    .values_list("pk", "user_id", "last_touched")
+                )
+                active = {user_id for _, user_id, touched in lines if touched >= before}
+                user_ids = sorted(candidates - active)
+                if user_ids:
+                    StockReservation.objects.release_users(user_ids)
+                    self.filter(
+                        pk__in=[pk for pk, user_id, _ in lines if user_id not in active]
+                    ).delete()
+            if user_ids:
+                yield user_ids
 
 
 class CartItem(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
+    last_touched = models.DateTimeField(default=timezone.now, db_index=True)
 
     objects = CartItemManager()
 
@@ -52,3 +214,120 @@ class CartItem(models.Model):
 
     def __str__(self):
         return f"{self.user} — {self.product.name} x {self.quantity}"
+
+
+class StockReservationManager(models.Manager):
+    def hold(self, user, product, quantity):
+        """Make the user's hold on ``product`` cover exactly ``quantity`` units,
+        taking or returning the difference and renewing its expiry. Must run
+        inside a transaction."""
+        reservation = self.select_for_update().filter(user=user, product=product).first()
+        held = reservation.quantity if reservation else 0
+        if quantity > held and not take_stock(product, quantity - held):
+            product.refresh_from_db(fields=["stock"])
+            shortfall = {
+                "product_id": product.pk,
+                "requested": quantity,
+                "available": held + available_stock(product),
+            }
+            raise ValidationError("Not enough stock.", params={"products": [shortfall]})
+        if quantity < held:
+            return_stock(product, held - quantity)
+
+        expires_at = timezone.now() + settings.STOCK_RESERVATION_TTL
+        if reservation is None:
+            return self.create(
+                user=user, product=product, quantity=quantity, expires_at=expires_at
+            )
+        reservation.quantity = quantity
+        reservation.expires_at = expires_at
+        reservation.save(update_fields=["quantity", "expires_at"])
+        return reservation
+
+    def _locked(self):
+        return self.select_for_update(of=("self",)).select_related("product")
+
+    @transaction.atomic
+    def release(self, user, product_id=None):
+        reservations = self._locked().filter(user=user)
+        if product_id is not None:
+            reservations = reservations.filter(product_id=product_id)
+        for reservation in reservations:
+            return_stock(reservation.product, reservation.quantity)
+            reservation.delete()
+
+    def _return(self, reservations):
+        """Put the stock of locked ``reservations`` back and delete them."""
+        products, returned = {}, {}
+        for reservation in reservations:
+            products[reservation.product_id] = reservation.product
+            returned[reservation.product_id] = (
+                returned.get(reservation.product_id, 0) + reservation.quantity
+            )
+        for product_id in sorted(returned):
+            return_stock(products[product_id], returned[product_id])
+        self.filter(pk__in=[r.pk for r in reservations]).delete()
+
+    def release_users(self, user_ids):
+        """Release every hold of ``user_ids``. Must run inside a transaction."""
+        self._return(list(self._locked().filter(user_id__in=user_ids)))
+
+    def convert(self, user, quantities):
+        """Turn the user's holds into sales of ``{product_id: quantity}``.
+
+        Returns how much of each quantity the holds already cover; held units
+        beyond the quantity go back to stock. Must run inside the checkout
+        transaction so that a failed checkout keeps the holds.
+        """
+        covered = {}
+        reservations = list(self._locked().filter(user=user).order_by("product_id"))
+        # Lock every unsharded product this checkout writes, in id order, before
+        # any stock is returned here or taken afterwards.
+        identity = current_identity_map()
+        products = identity.get_many(Product, quantities.keys())
+        products.update((r.product_id, r.product) for r in reservations)
+        identity.lock(Product, [pid for pid, p in products.items() if not p.stock_shards])
+        for reservation in reservations:
+            wanted = quantities.get(reservation.product_id, 0)
+            covered[reservation.product_id] = min(wanted, reservation.quantity)
+            if reservation.quantity > wanted:
+                return_stock(reservation.product, reservation.quantity - wanted)
+        self.filter(pk__in=[r.pk for r in reservations]).delete()
+        return covered
+
+    def expire(self, batch_size=500):
+        """Return stock held by expired reservations, one batch per
+        transaction, yielding the size of each batch."""
+        while True:
+            with transaction.atomic():
+                batch = list(
+                    self.select_for_update(skip_locked=True, of=("self",))
+                    .select_related("product")
+                    .filter(expires_at__lte=timezone.now())
+                    .order_by("expires_at")[:batch_size]
+                )
+                if not batch:
+                    return
+                self._return(batch)
+            yield len(batch)
+
+
+class StockReservation(models.Model):
+    """Stock taken off the shelf for a user's cart line until ``expires_at``."""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    objects = StockReservationManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "product"], name="unique_reservation_per_cart_line"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user} — {self.product.name} x {self.quantity} until {self.expires_at}"
@@ -4,9 +4,11 @@ from rest_framework import serializers
 from cart.models import CartItem
 from products.models import Product
 from products.serializers import ProductSerializer
+from store.fieldsets import SparseFieldsetMixin
+from store.identity import current_identity_map
 
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
 
     class Meta:
@@ -18,15 +20,40 @@ class CartAddSerializer(serializers.Serializer):
     product_id = serializers.IntegerField()
     quantity = serializers.IntegerField(min_value=1)
 
-    def validate_product_id(self, product_id):
+    def validate(self, attrs):
         try:
-            Product.objects.get(pk=product_id)
+            attrs["product"] = current_identity_map().get(Product, attrs["product_id"])
         except Product.DoesNotExist:
-            raise ValidationError("No such product.")
+            raise ValidationError({"product_id": "No such product."})
 
-        return product_id
+        return attrs
 
 
 class CartUpdateSerializer(serializers.Serializer):
     product_id = serializers.IntegerField()
     quantity = serializers.IntegerField(min_value=0)
+
+
+class CartBulkEntrySerializer(serializers.Serializer):
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=0, default=0)
+    op = serializers.ChoiceField(choices=["add", "set", "remove"], default="set")
+
+
+class CartBulkSerializer(serializers.Serializer):
+    entries = CartBulkEntrySerializer(many=True, allow_empty=False, max_length=200)
+
+    def validate(self, attrs):
+        product_ids = {entry["product_id"] for entry in attrs["entries"]}
+        attrs["products"] = current_identity_map().get_many(Product, product_ids)
+        unknown = sorted(product_ids - attrs["products"].keys())
+        if unknown:
+            raise ValidationError({"entries": f"No such products: {unknown}."})
+
+        return attrs
+
+
+class CartSummarySerializer(SparseFieldsetMixin, serializers.Serializer):
+    count = serializers.IntegerField(read_only=True)
+    total = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    items_version = serializers.IntegerField(read_only=True)
@@ -1,18 +1,152 @@
-from .models import CartItem
-from django.db.models import ObjectDoesNotExist
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.forms import ValidationError
+
+from products.models import Product
+from store.identity import current_identity_map
+
+from .models import CartItem, changed_lines, check_available_stock
+from .storage import get_cart_storage
+
+
+def _version_key(user_id):
+    return f"cart-version:{user_id}"
+
+
+def get_cart_version(user):
+    """A number that changes whenever the user's cart changes. A version
+    evicted from the cache restarts from the clock, past any older value."""
+    version = cache.get(_version_key(user.pk))
+    if version is None:
+        cache.add(_version_key(user.pk), time.time_ns(), None)
+        version = cache.get(_version_key(user.pk))
+    return version
+
+
+def _bump_cart_version(user):
+    def bump():
+        try:
+            cache.incr(_version_key(user.pk))
+        except ValueError:
+            cache.add(_version_key(user.pk), time.time_ns(), None)
+
+    # After commit, so that a version is never served with older contents.
+    transaction.on_commit(bump)
+
 
 def remove_from_cart(user, product_id):
-    CartItem.objects.filter(user=user, product_id=product_id).delete()
+    if get_cart_storage().remove(user, product_id):
+        _bump_cart_version(user)
 
 
 def get_cart(user):
+    """The user's cart rows in the database; call ``sync_cart`` first when the
+    live cart may only be in the cache."""
     return CartItem.objects.filter(user=user).select_related("product")
 
 
+def get_cart_items(user, defer=()):
+    """Return the cart lines; ``defer`` names CartItem columns (or
+    ``product__`` columns) the caller will not read."""
+    return get_cart_storage().items(user, defer=defer)
+
+
+def get_cart_summary(user):
+    count, total = get_cart_storage().summary(user)
+    return {"count": count, "total": total}
+
+
+def add_to_cart(user, product_id, quantity, product=None):
+    item = get_cart_storage().add(user, product_id, quantity, product=product)
+    _bump_cart_version(user)
+    return item
+
+
+def update_cart(user, product_id, quantity):
+    item = get_cart_storage().update(user, product_id, quantity)
+    _bump_cart_version(user)
+    return item
+
+
+def apply_cart_changes(user, entries, products):
+    get_cart_storage().apply(user, entries, products)
+    _bump_cart_version(user)
+
+
 def remove_product_from_cart(user, product_id):
-    try:
-        cart_item = CartItem.objects.get(user=user, product_id=product_id)
-        cart_item.delete()
-        return True
-    except ObjectDoesNotExist:
-        return False
+    removed = get_cart_storage().remove(user, product_id)
+    if removed:
+        _bump_cart_version(user)
+    return removed
+
+
+def apply_guest_changes(lines, entries, products):
+    """Return the guest cart ``lines`` with the bulk ``entries`` applied,
+    checked against available stock; nothing is written."""
+    changed = changed_lines(lines, entries)
+    check_available_stock(changed, products)
+    lines = {**lines, **changed}
+    lines = {pid: qty for pid, qty in lines.items() if qty}
+    if len(lines) > settings.GUEST_CART_MAX_LINES:
+        raise ValidationError(
+            f"A guest cart holds at most {settings.GUEST_CART_MAX_LINES} products."
+        )
+    return lines
+
+
+def get_guest_cart_items(lines):
+    products = current_identity_map().get_many(Product, lines.keys())
+    return [
+        CartItem(product=products[pid], quantity=qty)
+        for pid, qty in lines.items()
+        if pid in products
+    ]
+
+
+def merge_guest_cart(user, lines):
+    """Add the guest cart ``lines`` to the user's cart in one bulk write.
+    Lines whose stock has run out since are left out."""
+    products = current_identity_map().get_many(Product, lines.keys())
+    entries = [
+        {"product_id": pid, "quantity": qty, "op": "add"}
+        for pid, qty in lines.items()
+        if pid in products
+    ]
+    while entries:
+        try:
+            apply_cart_changes(user, entries, products)
+            return
+        except ValidationError as e:
+            if not e.params:
+                return
+            short = {line["product_id"] for line in e.params["products"]}
+            entries = [entry for entry in entries if entry["product_id"] not in short]
+
+
+def locked_cart(user):
+    """Keep other requests and flushes off the user's cart while it is checked
+    out; enter it outside the checkout transaction."""
+    return get_cart_storage().locked(user)
+
+
+def sync_cart(user):
+    get_cart_storage().sync(user)
+
+
+def forget_cart(user):
+    """Called once checkout has emptied the user's cart."""
+    get_cart_storage().forget(user)
+    _bump_cart_version(user)
+
+
+def purge_abandoned_carts(before, batch_size=1000):
+    """Delete carts untouched since ``before`` in batches, yielding the number
+    of carts in each batch."""
+    for user_ids in CartItem.objects.purge_abandoned(before, batch_size=batch_size):
+        get_cart_storage().forget_many(user_ids)
+        # A missing version restarts from the clock, past any served ETag.
+        cache.delete_many([_version_key(user_id) for user_id in user_ids])
+        yield len(user_ids)
@@ -0,0 +1,276 @@
+"""Where live carts are kept, selected with the CART_STORAGE setting.
+
+``DatabaseCartStorage`` reads and writes CartItem rows directly.
+``CacheCartStorage`` keeps each cart in the Django cache and writes it back
+to CartItem rows behind the request (write-behind): a timer flushes the carts
+this process changed every CART_FLUSH_INTERVAL seconds, and checkout calls
+``sync`` so the database copy is authoritative whenever an order is placed.
+Checkout holds the cart's lock (``locked``) until its transaction has
+committed and the cached cart is dropped, so neither a flush nor a concurrent
+write can bring the ordered lines back.
+It needs a cache shared by all processes (SHARED_CACHE); without one
+``get_cart_storage`` writes through to the database instead.
+"""
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import DecimalField, F, Sum
+from django.db.models.functions import Coalesce
+from django.forms import ValidationError
+from django.utils.module_loading import import_string
+
+from products.inventory import available_stock
+from products.models import Product
+from store.identity import current_identity_map
+
+from .models import CartItem, StockReservation, changed_lines, check_changed_lines
+
+
+def get_cart_storage():
+    storage = import_string(settings.CART_STORAGE)
+    if issubclass(storage, CacheCartStorage) and not settings.SHARED_CACHE:
+        # A per-process cache would give every process its own copy of a cart.
+        return DatabaseCartStorage()
+    return storage()
+
+
+class DatabaseCartStorage:
+    def items(self, user, defer=()):
+        return list(
+            CartItem.objects.filter(user=user).select_related("product").defer(*defer)
+        )
+
+    def add(self, user, product_id, quantity, product=None):
+        return CartItem.objects.add(
+            user=user, product_id=product_id, quantity=quantity, product=product
+        )
+
+    def update(self, user, product_id, quantity):
+        return CartItem.objects.update(user=user, product_id=product_id, quantity=quantity)
+
+    @transaction.atomic
+    def remove(self, user, product_id):
+        deleted, _ = CartItem.objects.filter(user=user, product_id=product_id).delete()
+        if deleted and settings.STOCK_RESERVATIONS:
+            StockReservation.objects.release(user, product_id)
+        return bool(deleted)
+
+    def apply(self, user, entries, products):
+        CartItem.objects.apply(user=user, entries=entries, products=products)
+
+    def summary(self, user):
+        summary = CartItem.objects.filter(user=user).aggregate(
+            count=Coalesce(Sum("quantity"), 0),
+            total=Coalesce(
+                Sum(F("quantity") * F("product__price")),
+                Decimal("0.00"),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+        )
+        return summary["count"], summary["total"]
+
+    def locked(self, user):
+        return nullcontext()
+
+    def sync(self, user):
+        pass
+
+    def forget(self, user):
+        pass
+
+    def forget_many(self, user_ids):
+        pass
+
+
+class CacheCartStorage(DatabaseCartStorage):
+    """Each cart is cached as ``{"lines", "version", "flushed"}``: writes bump
+    the version under a per-cart lock held in the cache, and a flush only
+    writes carts whose version is ahead of the one last written."""
+
+    LOCK_TIMEOUT = 5
+
+    _dirty = set()
+    _lock = threading.Lock()
+    _timer = None
+    _held = threading.local()
+
+    @staticmethod
+    def _key(user_id):
+        return f"cart:{user_id}"
+
+    @classmethod
+    @contextmanager
+    def _locked(cls, user_id):
+        """Serialize the read-modify-write of one cart across processes. A
+        lock left behind by a dead process expires after LOCK_TIMEOUT. The
+        thread holding the lock may take it again."""
+        held = cls._held.__dict__.setdefault("user_ids", set())
+        if user_id in held:
+            yield
+            return
+        key, token = f"cart-lock:{user_id}", uuid.uuid4().hex
+        while not cache.add(key, token, cls.LOCK_TIMEOUT):
+            time.sleep(0.005)
+        held.add(user_id)
+        try:
+            yield
+        finally:
+            held.discard(user_id)
+            if cache.get(key) == token:
+                cache.delete(key)
+
+    def _entry(self, user_id):
+        entry = cache.get(self._key(user_id))
+        if entry is None:
+            lines = dict(
+                CartItem.objects.filter(user_id=user_id).values_list("product_id", "quantity")
+            )
+            # Loaded from the database, so there is nothing to write back.
+            entry = {"lines": lines, "version": 0, "flushed": 0}
+            cache.add(self._key(user_id), entry, settings.CART_CACHE_TTL)
+        return entry
+
+    def _lines(self, user):
+        return self._entry(user.pk)["lines"]
+
+    def _save(self, user, entry, lines):
+        entry = {**entry, "lines": lines, "version": entry["version"] + 1}
+        cache.set(self._key(user.pk), entry, settings.CART_CACHE_TTL)
+        with self._lock:
+            self._dirty.add(user.pk)
+            if CacheCartStorage._timer is None:
+                CacheCartStorage._timer = threading.Timer(
+                    settings.CART_FLUSH_INTERVAL, self.flush
+                )
+                CacheCartStorage._timer.daemon = True
+                CacheCartStorage._timer.start()
+
+    @classmethod
+    def _write_back(cls, user_id, force=False):
+        """Write the cached cart to CartItem rows and record its version as
+        flushed. Carts already written, or dropped by checkout, are skipped
+        unless ``force`` is set."""
+        with cls._locked(user_id):
+            entry = cache.get(cls._key(user_id))
+            if entry is None or (entry["flushed"] == entry["version"] and not force):
+                return
+            CartItem.objects.replace(user_id, entry["lines"])
+            entry = {**entry, "flushed": entry["version"]}
+            cache.set(cls._key(user_id), entry, settings.CART_CACHE_TTL)
+
+    @classmethod
+    def flush(cls):
+        """Write every cart this process changed since the last flush."""
+        with cls._lock:
+            user_ids, cls._dirty = cls._dirty, set()
+            if cls._timer is not None:
+                cls._timer.cancel()
+                cls._timer = None
+        for user_id in user_ids:
+            cls._write_back(user_id)
+        if threading.current_thread() is not threading.main_thread():
+            connection.close()
+
+    def _set_line(self, user, product_id, quantity, product):
+        if product is None:
+            try:
+                product = current_identity_map().get(Product, product_id)
+            except Product.DoesNotExist:
+                raise ValidationError("No such product.")
+        if settings.STOCK_RESERVATIONS:
+            with transaction.atomic():
+                StockReservation.objects.hold(user, product, quantity)
+        elif quantity > available_stock(product):
+            raise ValidationError("Not enough stock.")
+        return CartItem(user=user, product=product, quantity=quantity)
+
+    def items(self, user, defer=()):
+        lines = self._lines(user)
+        products = current_identity_map().get_many(Product, lines.keys())
+        return [
+            CartItem(user=user, product=products[pid], quantity=qty)
+            for pid, qty in lines.items()
+            if pid in products
+        ]
+
+    def add(self, user, product_id, quantity, product=None):
+        if quantity <= 0:
+            raise ValidationError("Quantity must be positive.")
+        with self._locked(user.pk):
+            entry = self._entry(user.pk)
+            lines = dict(entry["lines"])
+            item = self._set_line(
+                user, product_id, lines.get(product_id, 0) + quantity, product
+            )
+            lines[product_id] = item.quantity
+            self._save(user, entry, lines)
+        return item
+
+    def update(self, user, product_id, quantity):
+        if quantity <= 0:
+            raise ValidationError("Quantity must be positive.")
+        with self._locked(user.pk):
+            entry = self._entry(user.pk)
+            item = self._set_line(user, product_id, quantity, None)
+            self._save(user, entry, {**entry["lines"], product_id: quantity})
+        return item
+
+    def remove(self, user, product_id):
+        with self._locked(user.pk):
+            entry = self._entry(user.pk)
+            lines = dict(entry["lines"])
+            if lines.pop(product_id, None) is None:
+                return False
+            if settings.STOCK_RESERVATIONS:
+                StockReservation.objects.release(user, product_id)
+            self._save(user, entry, lines)
+        return True
+
+    def apply(self, user, entries, products):
+        with self._locked(user.pk):
+            entry = self._entry(user.pk)
+            lines = dict(entry["lines"])
+            changed = changed_lines(lines, entries)
+            with transaction.atomic():
+                check_changed_lines(user, changed, products)
+            for pid, qty in changed.items():
+                if qty:
+                    lines[pid] = qty
+                else:
+                    lines.pop(pid, None)
+            self._save(user, entry, lines)
+
+    def summary(self, user):
+        lines = self._lines(user)
+        products = current_identity_map().get_many(Product, lines.keys())
+        return sum(lines.values()), sum(
+            (products[pid].price * qty for pid, qty in lines.items() if pid in products),
+            Decimal("0.00"),
+        )
+
+    def locked(self, user):
+        return self._locked(user.pk)
+
+    def sync(self, user):
+        # Checkout always writes: a rolled back checkout may have undone
+        # rows of a version already marked as flushed.
+        self._write_back(user.pk, force=True)
+        with self._lock:
+            self._dirty.discard(user.pk)
+
+    def forget(self, user):
+        with self._locked(user.pk):
+            cache.delete(self._key(user.pk))
+        with self._lock:
+            self._dirty.discard(user.pk)
+
+    def forget_many(self, user_ids):
+        cache.delete_many([self._key(user_id) for user_id in user_ids])
+        with self._lock:
+            self._dirty.difference_update(user_ids)
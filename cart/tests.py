@@ -1,15 +1,37 @@
+import threading
 import uuid
+from unittest import mock
+from datetime import timedelta
 from decimal import Decimal
-from django.test import TestCase
+from io import StringIO
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
 from django.db.utils import IntegrityError
 from rest_framework.test import APITestCase
 from rest_framework import status
+from rest_framework.exceptions import ValidationError as DRFValidationError
 from django.core.exceptions import ValidationError
 from users.models import User
+from products.inventory import rebalance, return_stock
 from products.models import Product
-from cart.models import CartItem
+from cart.models import CartItem, StockReservation
 from cart.serializers import CartItemSerializer, CartAddSerializer, CartUpdateSerializer
-from cart.services import remove_from_cart, get_cart, remove_product_from_cart
+from cart.services import (
+    add_to_cart,
+    apply_cart_changes,
+    get_cart,
+    get_cart_items,
+    get_cart_version,
+    remove_from_cart,
+    remove_product_from_cart,
+)
+from cart.storage import CacheCartStorage
+from orders.services import create_order_from_cart
+from store.identity import IdentityMap
 
 class CartItemModelTest(TestCase):
     def setUp(self):
@@ -115,6 +137,29 @@ class CartItemManagerTest(TestCase):
             )
         self.assertEqual(str(cm.exception), "['Not enough stock.']")
 
+    def test_add_is_a_single_statement(self):
+        CartItem.objects.create(user=self.user, product=self.product, quantity=3)
+        with self.assertNumQueries(1):
+            cart_item = CartItem.objects.add(
+                user=self.user,
+                product_id=self.product.id,
+                quantity=2,
+                product=self.product,
+            )
+        self.assertEqual(cart_item.quantity, 5)
+        self.assertEqual(CartItem.objects.get().quantity, 5)
+
+    def test_add_respects_sharded_stock(self):
+        rebalance(self.product, 3)
+        CartItem.objects.add(user=self.user, product_id=self.product.id, quantity=10)
+        with self.assertRaises(ValidationError):
+            CartItem.objects.add(user=self.user, product_id=self.product.id, quantity=1)
+
+    def test_update_unknown_product(self):
+        with self.assertRaises(ValidationError) as cm:
+            CartItem.objects.update(user=self.user, product_id=999, quantity=1)
+        self.assertEqual(str(cm.exception), "['No such product.']")
+
     def test_add_negative_quantity(self):
         with self.assertRaises(ValidationError) as cm:
             CartItem.objects.add(
@@ -395,6 +440,7 @@ class CartItemRemoveViewTest(APITestCase):
         response = self.client.delete(f'/api/cart/remove/{self.product.id}')
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
+@override_settings(SHARED_CACHE=True)
 class CartListViewTest(APITestCase):
     def setUp(self):
         self.user = User.objects.create_user(
@@ -427,6 +473,23 @@ class CartListViewTest(APITestCase):
         self.assertEqual(response.data[0]['quantity'], 3)
         self.assertEqual(response.data[0]['product']['id'], self.product.id)
 
+    def test_list_sparse_fieldset(self):
+        response = self.client.get('/api/cart/', {'fields': 'quantity,product.name'})
+        self.assertEqual(response.data, [{'quantity': 3, 'product': {'name': 'Test Product'}}])
+
+        response = self.client.get('/api/cart/', {'omit': 'id,product.description'})
+        self.assertEqual(set(response.data[0]), {'product', 'quantity'})
+        self.assertEqual(set(response.data[0]['product']), {'id', 'name', 'stock', 'price'})
+
+    def test_etag_depends_on_fieldset(self):
+        full = self.client.get('/api/cart/')
+        sparse = self.client.get('/api/cart/', {'fields': 'quantity'})
+        self.assertNotEqual(full['ETag'], sparse['ETag'])
+        response = self.client.get(
+            '/api/cart/', {'fields': 'quantity'}, HTTP_IF_NONE_MATCH=full['ETag']
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
     def test_list_empty_cart(self):
         CartItem.objects.all().delete()
         response = self.client.get('/api/cart/')
@@ -437,3 +500,507 @@ class CartListViewTest(APITestCase):
         self.client.credentials()
         response = self.client.get('/api/cart/')
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class CartBulkViewTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username=f'testuser_{uuid.uuid4().hex[:8]}',
+            email=f'test_{uuid.uuid4().hex[:8]}@example.com',
+            password='password123'
+        )
+        self.products = [
+            Product.objects.create(name=f'Product {i}', price=Decimal('10.00'), stock=10)
+            for i in range(3)
+        ]
+        CartItem.objects.create(user=self.user, product=self.products[0], quantity=2)
+        CartItem.objects.create(user=self.user, product=self.products[1], quantity=2)
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_changes(self):
+        p0, p1, p2 = self.products
+        response = self.client.post('/api/cart/bulk/', {'entries': [
+            {'product_id': p0.id, 'quantity': 3, 'op': 'add'},
+            {'product_id': p1.id, 'op': 'remove'},
+            {'product_id': p2.id, 'quantity': 4},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            {item['product']['id']: item['quantity'] for item in response.data},
+            {p0.id: 5, p2.id: 4},
+        )
+        self.assertEqual(CartItem.objects.filter(user=self.user).count(), 2)
+
+    def test_stock_shortfall_changes_nothing(self):
+        p0, p1, _ = self.products
+        response = self.client.post('/api/cart/bulk/', {'entries': [
+            {'product_id': p1.id, 'op': 'remove'},
+            {'product_id': p0.id, 'quantity': 11},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['detail'], 'Not enough stock.')
+        self.assertEqual(response.data['products'][0]['product_id'], p0.id)
+        self.assertEqual(CartItem.objects.get(product=p0).quantity, 2)
+        self.assertTrue(CartItem.objects.filter(product=p1).exists())
+
+    @override_settings(STOCK_RESERVATIONS=True)
+    def test_stock_shortfall_with_reservations(self):
+        p0, p1, _ = self.products
+        response = self.client.post('/api/cart/bulk/', {'entries': [
+            {'product_id': p1.id, 'op': 'remove'},
+            {'product_id': p0.id, 'quantity': 11},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.data['products'],
+            [{'product_id': p0.id, 'requested': 11, 'available': 10}],
+        )
+        self.assertTrue(CartItem.objects.filter(product=p1).exists())
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_stock_is_checked_against_current_rows(self):
+        p0 = self.products[0]
+        Product.objects.filter(pk=p0.pk).update(stock=1)
+        with self.assertRaises(ValidationError) as raised:
+            apply_cart_changes(
+                self.user, [{'product_id': p0.id, 'quantity': 5, 'op': 'set'}], {p0.id: p0}
+            )
+        self.assertEqual(raised.exception.params['products'][0]['available'], 1)
+        self.assertEqual(CartItem.objects.get(product=p0).quantity, 2)
+
+    def test_unknown_product(self):
+        response = self.client.post('/api/cart/bulk/', {'entries': [
+            {'product_id': 999, 'quantity': 1},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('999', str(response.data['entries']))
+
+    def test_query_count_does_not_grow_with_entries(self):
+        entries = [{'product_id': p.id, 'quantity': 1} for p in self.products]
+        with self.assertNumQueries(7):
+            self.client.post('/api/cart/bulk/', {'entries': entries[:1]}, format='json')
+        with self.assertNumQueries(7):
+            self.client.post('/api/cart/bulk/', {'entries': entries}, format='json')
+
+@override_settings(SHARED_CACHE=True)
+class CartSummaryViewTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username=f'testuser_{uuid.uuid4().hex[:8]}',
+            email=f'test_{uuid.uuid4().hex[:8]}@example.com',
+            password='password123'
+        )
+        self.product = Product.objects.create(name='A', price=Decimal('10.00'), stock=10)
+        self.other = Product.objects.create(name='B', price=Decimal('2.50'), stock=10)
+        CartItem.objects.create(user=self.user, product=self.product, quantity=2)
+        CartItem.objects.create(user=self.user, product=self.other, quantity=3)
+        self.client.force_authenticate(self.user)
+
+    def test_summary_is_one_aggregate(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/cart/summary/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(response.data['total'], '27.50')
+        self.assertEqual(response.data['items_version'], get_cart_version(self.user))
+
+    def test_empty_cart_summary(self):
+        CartItem.objects.all().delete()
+        response = self.client.get('/api/cart/summary/')
+        self.assertEqual(response.data['count'], 0)
+        self.assertEqual(response.data['total'], '0.00')
+
+    def test_unchanged_cart_is_not_modified(self):
+        for url in ('/api/cart/summary/', '/api/cart/'):
+            etag = self.client.get(url)['ETag']
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response['ETag'], etag)
+
+    def test_mutation_changes_etag(self):
+        etag = self.client.get('/api/cart/summary/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                '/api/cart/add/', {'product_id': self.other.id, 'quantity': 1}, format='json'
+            )
+        response = self.client.get('/api/cart/summary/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['count'], 6)
+
+    def test_price_change_changes_etag(self):
+        for url in ('/api/cart/summary/', '/api/cart/'):
+            etag = self.client.get(url)['ETag']
+            with self.captureOnCommitCallbacks(execute=True):
+                self.product.price += Decimal('1.00')
+                self.product.save()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotEqual(response['ETag'], etag)
+
+    @override_settings(STOCK_RESERVATIONS=True)
+    def test_stock_movement_keeps_etag(self):
+        etag = self.client.get('/api/cart/')['ETag']
+        buyer = User.objects.create_user(username='buyer', password='password123')
+        with self.captureOnCommitCallbacks(execute=True):
+            add_to_cart(buyer, self.product.id, 1)
+            remove_from_cart(buyer, self.product.id)
+            Product.objects.get(pk=self.product.pk).save(update_fields=['stock'])
+        response = self.client.get('/api/cart/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    @override_settings(SHARED_CACHE=False)
+    def test_no_etag_without_shared_cache(self):
+        response = self.client.get('/api/cart/summary/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.has_header('ETag'))
+
+@override_settings(
+    CART_STORAGE='cart.storage.CacheCartStorage', CART_FLUSH_INTERVAL=3600, SHARED_CACHE=True
+)
+class CacheCartStorageTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username=f'testuser_{uuid.uuid4().hex[:8]}',
+            email=f'test_{uuid.uuid4().hex[:8]}@example.com',
+            password='password123',
+            balance=Decimal('100.00'),
+        )
+        self.product = Product.objects.create(
+            name='Test Product',
+            price=Decimal('10.00'),
+            stock=10
+        )
+        self.client.force_authenticate(self.user)
+        self.addCleanup(CacheCartStorage.flush)
+
+    def test_writes_stay_in_cache_until_flush(self):
+        response = self.client.post(
+            '/api/cart/add/', {'product_id': self.product.id, 'quantity': 2}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.client.post(
+            '/api/cart/add/', {'product_id': self.product.id, 'quantity': 3}, format='json'
+        )
+        self.assertFalse(CartItem.objects.exists())
+
+        response = self.client.get('/api/cart/')
+        self.assertEqual(response.data[0]['quantity'], 5)
+
+        CacheCartStorage.flush()
+        self.assertEqual(CartItem.objects.get(user=self.user).quantity, 5)
+
+    def test_stock_is_checked(self):
+        response = self.client.post(
+            '/api/cart/add/', {'product_id': self.product.id, 'quantity': 11}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_remove_after_flush(self):
+        add_to_cart(self.user, self.product.id, 2)
+        CacheCartStorage.flush()
+        self.assertTrue(remove_product_from_cart(self.user, self.product.id))
+        self.assertFalse(remove_product_from_cart(self.user, self.product.id))
+        CacheCartStorage.flush()
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_checkout_syncs_cart(self):
+        add_to_cart(self.user, self.product.id, 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            order = create_order_from_cart(self.user)
+        self.assertEqual(order.total, Decimal('20.00'))
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(get_cart_items(self.user), [])
+
+    def test_flush_does_not_bring_back_checked_out_lines(self):
+        add_to_cart(self.user, self.product.id, 2)
+        # The cart is only forgotten once checkout commits; a flush running
+        # before that must not write the ordered lines back.
+        with self.captureOnCommitCallbacks(execute=False):
+            create_order_from_cart(self.user)
+        CacheCartStorage._dirty.add(self.user.pk)
+        CacheCartStorage.flush()
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_concurrent_adds_are_not_lost(self):
+        add_to_cart(self.user, self.product.id, 1, product=self.product)
+        threads = [
+            threading.Thread(
+                target=add_to_cart, args=(self.user, self.product.id, 1, self.product)
+            )
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(get_cart_items(self.user)[0].quantity, 9)
+
+    @override_settings(SHARED_CACHE=False)
+    def test_writes_through_without_shared_cache(self):
+        add_to_cart(self.user, self.product.id, 2)
+        self.assertEqual(CartItem.objects.get(user=self.user).quantity, 2)
+        self.assertIsNone(cache.get(CacheCartStorage._key(self.user.pk)))
+
+@override_settings(
+    CART_STORAGE='cart.storage.CacheCartStorage', CART_FLUSH_INTERVAL=3600, SHARED_CACHE=True
+)
+class CacheCartCheckoutTest(TransactionTestCase):
+    """Checkout against the cached cart, with real commits."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='buyer', password='password123', balance=Decimal('100.00')
+        )
+        self.product = Product.objects.create(name='Ordered', price=Decimal('10.00'), stock=10)
+        self.other = Product.objects.create(name='Added', price=Decimal('5.00'), stock=10)
+        self.addCleanup(CacheCartStorage.flush)
+
+    def test_cart_stays_locked_until_checkout_is_committed(self):
+        add_to_cart(self.user, self.product.id, 2)
+        adding = threading.Thread(
+            target=add_to_cart, args=(self.user, self.other.id, 1, self.other)
+        )
+
+        def add_during_checkout():
+            adding.start()
+            adding.join(0.05)
+            self.assertTrue(adding.is_alive())
+
+        with mock.patch(
+            'orders.services.bump_catalog_version', side_effect=add_during_checkout
+        ):
+            create_order_from_cart(self.user)
+        adding.join()
+        CacheCartStorage.flush()
+
+        self.assertEqual(
+            list(CartItem.objects.values_list('product_id', 'quantity')), [(self.other.id, 1)]
+        )
+        self.assertEqual([item.product for item in get_cart_items(self.user)], [self.other])
+
+    def test_failed_checkout_releases_cart(self):
+        with self.assertRaises(DRFValidationError):
+            create_order_from_cart(self.user)
+        self.assertIsNone(cache.get(f'cart-lock:{self.user.pk}'))
+
+
+@override_settings(STOCK_RESERVATIONS=True)
+class StockReservationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username=f"testuser_{uuid.uuid4().hex[:8]}",
+            email=f"test_{uuid.uuid4().hex[:8]}@example.com",
+            password="password123",
+            balance=Decimal("100.00"),
+        )
+        self.product = Product.objects.create(
+            name="Test Product", price=Decimal("10.00"), stock=5
+        )
+
+    def test_add_takes_stock(self):
+        CartItem.objects.add(self.user, self.product.id, 2)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 3)
+        self.assertEqual(StockReservation.objects.get(user=self.user).quantity, 2)
+
+    def test_add_beyond_stock_fails(self):
+        with self.assertRaises(ValidationError):
+            CartItem.objects.add(self.user, self.product.id, 6)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+
+    def test_update_returns_difference(self):
+        CartItem.objects.add(self.user, self.product.id, 4)
+        CartItem.objects.update(self.user, self.product.id, 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 4)
+
+    def test_remove_releases_hold(self):
+        CartItem.objects.add(self.user, self.product.id, 3)
+        remove_from_cart(self.user, self.product.id)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_checkout_uses_hold(self):
+        CartItem.objects.add(self.user, self.product.id, 3)
+        create_order_from_cart(self.user)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 2)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_checkout_locks_products_before_returning_holds(self):
+        other = Product.objects.create(name="Other", price=Decimal("1.00"), stock=5)
+        CartItem.objects.add(self.user, self.product.id, 3)
+        CartItem.objects.add(self.user, other.id, 2)
+        # A hold without its cart line is returned by checkout.
+        CartItem.objects.filter(product=other).delete()
+
+        events = []
+        lock = IdentityMap.lock
+
+        def recording_lock(identity, model, pks):
+            events.append(("lock", sorted(pks)))
+            return lock(identity, model, pks)
+
+        def recording_return(product, quantity):
+            events.append(("return", product.pk))
+            return_stock(product, quantity)
+
+        with mock.patch.object(IdentityMap, "lock", recording_lock), \
+                mock.patch("cart.models.return_stock", recording_return):
+            create_order_from_cart(self.user)
+        self.assertEqual(events[:2], [
+            ("lock", sorted([self.product.id, other.id])), ("return", other.id),
+        ])
+        other.refresh_from_db()
+        self.assertEqual(other.stock, 5)
+
+    def test_expired_holds_are_returned(self):
+        CartItem.objects.add(self.user, self.product.id, 3)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+
+        out = StringIO()
+        call_command("expire_reservations", stdout=out)
+        self.assertIn("Expired 1", out.getvalue())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+
+
+class PurgeAbandonedCartsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(name='Product', price=Decimal('10.00'), stock=10)
+        self.product2 = Product.objects.create(name='Product 2', price=Decimal('5.00'), stock=10)
+        self.users = [
+            User.objects.create_user(username=f'user_{i}', password='x') for i in range(3)
+        ]
+        for user in self.users:
+            CartItem.objects.create(user=user, product=self.product, quantity=1)
+        CartItem.objects.all().update(last_touched=timezone.now() - timedelta(days=40))
+
+    def test_cart_writes_touch_lines(self):
+        user = self.users[0]
+        add_to_cart(user, self.product.id, 1)
+        item = CartItem.objects.get(user=user)
+        self.assertGreater(item.last_touched, timezone.now() - timedelta(minutes=1))
+
+    def test_purge_keeps_carts_with_recent_lines(self):
+        # One recent line keeps the whole cart, including its old lines.
+        add_to_cart(self.users[0], self.product2.id, 1)
+
+        out = StringIO()
+        call_command('purge_abandoned_carts', '--batch-size=1', '--sleep=0', stdout=out)
+        self.assertIn('Deleted 2 abandoned carts.', out.getvalue())
+        self.assertEqual(out.getvalue().count('Deleted a batch of 1 carts.'), 2)
+        self.assertEqual(
+            list(CartItem.objects.values_list('user_id', flat=True).distinct()),
+            [self.users[0].id],
+        )
+        self.assertEqual(CartItem.objects.count(), 2)
+
+    def test_purge_releases_reservations(self):
+        user = self.users[1]
+        StockReservation.objects.create(
+            user=user, product=self.product, quantity=1,
+            expires_at=timezone.now() + timedelta(minutes=5),
+        )
+        Product.objects.filter(pk=self.product.pk).update(stock=9)
+        call_command('purge_abandoned_carts', '--sleep=0', stdout=StringIO())
+        self.assertFalse(StockReservation.objects.exists())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 10)
+
+    def test_purge_batches_are_limited_by_lines(self):
+        for user in self.users:
+            CartItem.objects.create(
+                user=user, product=self.product2, quantity=1,
+                last_touched=timezone.now() - timedelta(days=40),
+            )
+        before = timezone.now() - timedelta(days=30)
+        batches = list(CartItem.objects.purge_abandoned(before, batch_size=3))
+        self.assertEqual(batches, [[self.users[0].id, self.users[1].id], [self.users[2].id]])
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_purge_respects_age(self):
+        out = StringIO()
+        call_command('purge_abandoned_carts', '--days=60', '--sleep=0', stdout=out)
+        self.assertIn('Deleted 0 abandoned carts.', out.getvalue())
+        self.assertEqual(CartItem.objects.count(), 3)
+
+    def test_purge_invalidates_cart_version(self):
+        user = self.users[1]
+        version = get_cart_version(user)
+        call_command('purge_abandoned_carts', '--sleep=0', stdout=StringIO())
+        self.assertNotEqual(get_cart_version(user), version)
+
+
+class GuestCartViewTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username=f'testuser_{uuid.uuid4().hex[:8]}',
+            email=f'test_{uuid.uuid4().hex[:8]}@example.com',
+            password='password123'
+        )
+        self.product = Product.objects.create(name='Product', price=Decimal('10.00'), stock=10)
+        self.product2 = Product.objects.create(name='Product 2', price=Decimal('5.00'), stock=2)
+        self.url = reverse('cart-guest')
+
+    def add(self, *entries):
+        return self.client.post(self.url, {'entries': list(entries)}, format='json')
+
+    def test_guest_cart_lives_in_cookie(self):
+        with self.assertNumQueries(1):
+            response = self.add(
+                {'product_id': self.product.id, 'quantity': 2, 'op': 'add'},
+                {'product_id': self.product2.id, 'quantity': 1},
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(settings.GUEST_CART_COOKIE, response.cookies)
+        self.assertFalse(CartItem.objects.exists())
+
+        self.add({'product_id': self.product.id, 'quantity': 1, 'op': 'add'})
+        response = self.client.get(self.url)
+        self.assertEqual(
+            {line['product']['id']: line['quantity'] for line in response.data},
+            {self.product.id: 3, self.product2.id: 1},
+        )
+
+    def test_not_enough_stock(self):
+        response = self.add({'product_id': self.product2.id, 'quantity': 3})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['products'][0]['available'], 2)
+        self.assertNotIn(settings.GUEST_CART_COOKIE, response.cookies)
+
+    def test_tampered_cookie_is_ignored(self):
+        self.client.cookies[settings.GUEST_CART_COOKIE] = 'not-signed'
+        response = self.client.get(self.url)
+        self.assertEqual(response.data, [])
+
+    def test_guest_cart_merged_when_token_obtained(self):
+        CartItem.objects.create(user=self.user, product=self.product, quantity=1)
+        self.add(
+            {'product_id': self.product.id, 'quantity': 2},
+            {'product_id': self.product2.id, 'quantity': 2},
+        )
+        self.product2.stock = 1
+        self.product2.save()
+
+        response = self.client.post('/api/user/token/', {
+            'username': self.user.username,
+            'password': 'password123'
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('access', response.data)
+        self.assertEqual(response.cookies[settings.GUEST_CART_COOKIE].value, '')
+        # The product that ran out is left out; the rest is added on top.
+        self.assertEqual(
+            dict(CartItem.objects.filter(user=self.user).values_list('product_id', 'quantity')),
+            {self.product.id: 3},
+        )
@@ -1,9 +1,20 @@
 from django.urls import path
-from .views import CartItemAddView, CartItemUpdateView, CartItemRemoveView, CartListView
+from .views import (
+    CartBulkView,
+    CartItemAddView,
+    CartItemRemoveView,
+    CartItemUpdateView,
+    CartListView,
+    CartSummaryView,
+    GuestCartView,
+)
 
 urlpatterns = [
     path("add/", CartItemAddView.as_view(), name="cart-add"),
     path("update/", CartItemUpdateView.as_view(), name="cart-update"),
+    path("bulk/", CartBulkView.as_view(), name="cart-bulk"),
+    path("guest/", GuestCartView.as_view(), name="cart-guest"),
+    path("summary/", CartSummaryView.as_view(), name="cart-summary"),
     path("remove/<int:product_id>", CartItemRemoveView.as_view(), name="cart-remove"),
     path("", CartListView.as_view(), name="cart-list"),
 ]
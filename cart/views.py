@@ -1,14 +1,30 @@
-from .models import CartItem
-from .serializers import CartAddSerializer, CartUpdateSerializer, CartItemSerializer
+from .serializers import (
+    CartAddSerializer,
+    CartBulkSerializer,
+    CartItemSerializer,
+    CartSummarySerializer,
+    CartUpdateSerializer,
+)
+from .guest import read_guest_cart, write_guest_cart
 from .services import (
-
+    add_to_cart,
+    apply_cart_changes,
+    apply_guest_changes,
+    get_cart_items,
+    get_cart_summary,
+    get_cart_version,
+    get_guest_cart_items,
     remove_from_cart,
-    get_cart,
     remove_product_from_cart,
+    update_cart,
 )
+from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.utils.http import parse_etags
+from products.cache import get_product_version
+from store.fieldsets import deferred_columns, fieldset_suffix
 from rest_framework import generics, status, views
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
 
@@ -20,10 +36,11 @@ class CartItemAddView(generics.GenericAPIView):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         try:
-            cart_item = CartItem.objects.add(
+            cart_item = add_to_cart(
                 user=self.request.user,
                 product_id=serializer.validated_data["product_id"],
                 quantity=serializer.validated_data["quantity"],
+                product=serializer.validated_data["product"],
             )
             return Response(
                 CartItemSerializer(cart_item).data, status=status.HTTP_201_CREATED
@@ -47,7 +64,7 @@ class CartItemUpdateView(generics.GenericAPIView):
             return Response(status=status.HTTP_204_NO_CONTENT)
 
         try:
-            cart_item = CartItem.objects.update(
+            cart_item = update_cart(
                 user=self.request.user,
                 product_id=serializer.validated_data["product_id"],
                 quantity=serializer.validated_data["quantity"],
@@ -60,6 +77,30 @@ class CartItemUpdateView(generics.GenericAPIView):
 
 
 
+class CartBulkView(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = CartBulkSerializer
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            apply_cart_changes(
+                user=self.request.user,
+                entries=serializer.validated_data["entries"],
+                products=serializer.validated_data["products"],
+            )
+        except ValidationError as e:
+            data = {"detail": e.message}
+            if e.params:
+                data["products"] = e.params["products"]
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+        cart_items = get_cart_items(user=self.request.user)
+        return Response(
+            CartItemSerializer(cart_items, many=True).data, status=status.HTTP_200_OK
+        )
+
+
 class CartItemRemoveView(views.APIView):
     permission_classes = [IsAuthenticated]
 
@@ -72,11 +113,86 @@ class CartItemRemoveView(views.APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class CartListView(generics.GenericAPIView):
+class CartVersionETagMixin:
+    """Answer GET with 304 Not Modified, before loading any cart rows, while
+    the cart and product versions match the client's ETag. The product version
+    covers the prices and names in the body; stock taken or returned by other
+    carts does not change it, so the stock shown may lag until the next change.
+
+    Without a shared cache each process has its own versions, so no ETag is
+    sent."""
+
+    etag_prefix = None
+
+    def get(self, request, *args, **kwargs):
+        version = get_cart_version(request.user)
+        if not settings.SHARED_CACHE:
+            response = Response(self.get_data(version), status=status.HTTP_200_OK)
+            response["Cache-Control"] = "private, no-cache"
+            return response
+        etag = (
+            f'"{self.etag_prefix}-{request.user.pk}-{version}'
+            f'-{get_product_version()}{fieldset_suffix(request)}"'
+        )
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(self.get_data(version), status=status.HTTP_200_OK)
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        return response
+
+
+class CartListView(CartVersionETagMixin, generics.GenericAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = CartItemSerializer
+    etag_prefix = "cart"
+
+    def get_data(self, version):
+        cart_items = get_cart_items(
+            user=self.request.user, defer=deferred_columns(self.get_serializer())
+        )
+        return self.get_serializer(cart_items, many=True).data
+
+
+class CartSummaryView(CartVersionETagMixin, generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = CartSummarySerializer
+    etag_prefix = "cart-summary"
+
+    def get_data(self, version):
+        summary = get_cart_summary(self.request.user)
+        return self.get_serializer({**summary, "items_version": version}).data
+
+
+class GuestCartView(generics.GenericAPIView):
+    """The cart of an anonymous user, kept in a signed cookie. POST takes the
+    same entries as the bulk endpoint."""
+
+    permission_classes = [AllowAny]
+    serializer_class = CartBulkSerializer
 
     def get(self, request, *args, **kwargs):
-        cart_items = get_cart(user=self.request.user)
-        serializer = self.get_serializer(cart_items, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        items = get_guest_cart_items(read_guest_cart(request))
+        return Response(CartItemSerializer(items, many=True).data)
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            lines = apply_guest_changes(
+                read_guest_cart(request),
+                entries=serializer.validated_data["entries"],
+                products=serializer.validated_data["products"],
+            )
+        except ValidationError as e:
+            data = {"detail": e.message}
+            if e.params:
+                data["products"] = e.params["products"]
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+        response = Response(
+            CartItemSerializer(get_guest_cart_items(lines), many=True).data,
+            status=status.HTTP_200_OK,
+        )
+        write_guest_cart(response, lines)
+        return response
@@ -0,0 +1,64 @@
+from functools import wraps
+
+from rest_framework import status
+from rest_framework.response import Response
+
+from .services import claim_key, store_response
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def _replay(record, path):
+    if record is None or record.status_code is None:
+        return Response(
+            {"detail": "A request with this Idempotency-Key is still being processed."},
+            status=status.HTTP_409_CONFLICT,
+        )
+    if record.path != path:
+        return Response(
+            {"detail": "Idempotency-Key was already used for a different endpoint."},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    response = Response(record.response, status=record.status_code)
+    response[REPLAYED_HEADER] = "true"
+    return response
+
+
+def idempotent(handler):
+    """Make an authenticated view handler replay its first successful response
+    for repeated requests carrying the same ``Idempotency-Key`` header.
+
+    Failed requests release the key so the client can retry with it; a key
+    left claimed by a process that died is taken over after
+    IDEMPOTENCY_KEY_LEASE.
+    """
+
+    @wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return handler(view, request, *args, **kwargs)
+        if len(key) > 255:
+            return Response(
+                {"detail": "Idempotency-Key must be at most 255 characters."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        record, created = claim_key(request.user, key, request.path)
+        if not created:
+            return _replay(record, request.path)
+
+        try:
+            response = handler(view, request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+
+        if status.is_success(response.status_code):
+            store_response(record, response)
+        else:
+            record.delete()
+        return response
+
+    return wrapper
@@ -0,0 +1,24 @@
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+from users.models import User
+
+
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    path = models.CharField(max_length=255)
+    # Both stay empty while the original request is still being processed.
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "key"], name="unique_idempotency_key_per_user"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}:{self.key}"
@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+
+def _expires_before():
+    return timezone.now() - settings.IDEMPOTENCY_KEY_TTL
+
+
+def _take_over(record, path):
+    """Claim ``record`` when the request that claimed it stopped without
+    releasing it (a killed worker) more than IDEMPOTENCY_KEY_LEASE ago."""
+    now = timezone.now()
+    taken = IdempotencyKey.objects.filter(
+        pk=record.pk,
+        status_code__isnull=True,
+        created_at__lt=now - settings.IDEMPOTENCY_KEY_LEASE,
+    ).update(created_at=now, path=path)
+    if taken:
+        record.created_at, record.path = now, path
+    return bool(taken)
+
+
+def claim_key(user, key, path):
+    """Return ``(record, created)`` for ``key``.
+
+    ``created`` is True when the caller owns the key and must run the request,
+    including a key whose earlier request died without answering; otherwise
+    ``record`` is the earlier (possibly still running) request, or None when a
+    concurrent request claimed the key in the meantime.
+    """
+    record = IdempotencyKey.objects.filter(user=user, key=key).first()
+    if record is not None:
+        if record.status_code is None and _take_over(record, path):
+            return record, True
+        if record.created_at >= _expires_before():
+            return record, False
+        record.delete()
+
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(user=user, key=key, path=path), True
+    except IntegrityError:
+        return IdempotencyKey.objects.filter(user=user, key=key).first(), False
+
+
+def store_response(record, response):
+    record.status_code = response.status_code
+    record.response = response.data
+    record.save(update_fields=["status_code", "response"])
+
+
+def purge_expired_keys(batch_size=1000):
+    deleted = 0
+    expired = IdempotencyKey.objects.filter(created_at__lt=_expires_before())
+    while True:
+        batch = list(expired.values_list("pk", flat=True)[:batch_size])
+        if not batch:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(pk__in=batch).delete()[0]
@@ -0,0 +1,144 @@
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from cart.models import CartItem
+from idempotency.models import IdempotencyKey
+from orders.models import Order
+from products.models import Product
+from users.models import User
+
+
+class IdempotentViewTestMixin:
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username=f"testuser_{uuid.uuid4().hex[:8]}",
+            email=f"test_{uuid.uuid4().hex[:8]}@example.com",
+            password="password123",
+            balance=Decimal("100.00"),
+        )
+        response = self.client.post(
+            "/api/user/token/",
+            {"username": self.user.username, "password": "password123"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK, msg=response.content)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + response.data["access"])
+
+
+class OrderCreateIdempotencyTest(IdempotentViewTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("create-order")
+        self.product = Product.objects.create(
+            name="Test Product", price=Decimal("10.00"), stock=5
+        )
+        CartItem.objects.create(user=self.user, product=self.product, quantity=2)
+
+    def test_retry_replays_original_response(self):
+        first = self.client.post(self.url, HTTP_IDEMPOTENCY_KEY="order-1")
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+
+        with self.assertNumQueries(2):
+            retry = self.client.post(self.url, HTTP_IDEMPOTENCY_KEY="order-1")
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_new_key_runs_checkout_again(self):
+        self.client.post(self.url, HTTP_IDEMPOTENCY_KEY="order-1")
+        response = self.client.post(self.url, HTTP_IDEMPOTENCY_KEY="order-2")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("Cart can't be empty", str(response.data))
+
+    def test_failed_request_releases_key(self):
+        CartItem.objects.filter(user=self.user).update(quantity=10)
+        response = self.client.post(self.url, HTTP_IDEMPOTENCY_KEY="order-1")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        CartItem.objects.filter(user=self.user).update(quantity=2)
+        response = self.client.post(self.url, HTTP_IDEMPOTENCY_KEY="order-1")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_request_in_progress_conflicts(self):
+        IdempotencyKey.objects.create(user=self.user, key="order-1", path=self.url)
+        response = self.client.post(self.url, HTTP_IDEMPOTENCY_KEY="order-1")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_crashed_request_releases_key(self):
+        with mock.patch("orders.views.create_order_from_cart", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.post(self.url, HTTP_IDEMPOTENCY_KEY="order-1")
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_abandoned_claim_is_taken_over(self):
+        IdempotencyKey.objects.create(user=self.user, key="order-1", path=self.url)
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(minutes=3))
+        response = self.client.post(self.url, HTTP_IDEMPOTENCY_KEY="order-1")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        retry = self.client.post(self.url, HTTP_IDEMPOTENCY_KEY="order-1")
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_reused_on_other_endpoint(self):
+        self.client.post(self.url, HTTP_IDEMPOTENCY_KEY="shared")
+        response = self.client.post(
+            "/api/user/balance/deposit/",
+            {"amount": "5.00"},
+            format="json",
+            HTTP_IDEMPOTENCY_KEY="shared",
+        )
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def test_expired_key_is_not_replayed(self):
+        self.client.post(self.url, HTTP_IDEMPOTENCY_KEY="order-1")
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        response = self.client.post(self.url, HTTP_IDEMPOTENCY_KEY="order-1")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class DepositIdempotencyTest(IdempotentViewTestMixin, APITestCase):
+    url = "/api/user/balance/deposit/"
+
+    def test_retry_deposits_once(self):
+        for _ in range(3):
+            response = self.client.post(
+                self.url, {"amount": "50.00"}, format="json", HTTP_IDEMPOTENCY_KEY="dep-1"
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data["balance"], "150.00")
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal("150.00"))
+
+    def test_without_header_is_not_idempotent(self):
+        self.client.post(self.url, {"amount": "50.00"}, format="json")
+        self.client.post(self.url, {"amount": "50.00"}, format="json")
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal("200.00"))
+
+
+class PurgeIdempotencyKeysCommandTest(IdempotentViewTestMixin, APITestCase):
+    def test_purges_only_expired_keys(self):
+        IdempotencyKey.objects.create(user=self.user, key="old", path="/", status_code=200)
+        IdempotencyKey.objects.create(user=self.user, key="new", path="/", status_code=200)
+        IdempotencyKey.objects.filter(key="old").update(
+            created_at=timezone.now() - timedelta(days=2)
+        )
+
+        out = StringIO()
+        call_command("purge_idempotency_keys", batch_size=1, stdout=out)
+        self.assertIn("Purged 1", out.getvalue())
+        self.assertEqual(
+            list(IdempotencyKey.objects.values_list("key", flat=True)), ["new"]
+        )
@@ -11,9 +11,17 @@ class OrderItemInline(admin.TabularInline):
 class OrderAdmin(admin.ModelAdmin):
     inlines = [OrderItemInline]
     list_display = ("id", "user", "total", "created_at")
-    date_hierarchy = "created_at"
+    # date_hierarchy aggregates dates over every partition; the date filter
+    # only adds created_at ranges that let PostgreSQL prune partitions.
+    list_filter = (("created_at", admin.DateFieldListFilter),)
+    list_select_related = ("user",)
+    ordering = ("-created_at", "-id")
+    show_full_result_count = False
 
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
-    list_display = ("order", "product", "quantity", "price")
+    list_display = ("order", "product", "quantity", "price", "created_at")
+    list_filter = (("created_at", admin.DateFieldListFilter),)
+    list_select_related = ("order", "product")
+    show_full_result_count = False
@@ -0,0 +1,92 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import prefetch_related_objects
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from products.models import Product
+from store.identity import current_identity_map
+
+from .models import Order, OrderItem
+from .serializers import OrderSerializer
+
+# An order is rendered once and the payload is stored with it (Order.snapshot),
+# so it keeps showing its products as they were then and is valid until the
+# order itself is deleted (see orders/signals.py).
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+
+def _key(order_id):
+    return f"order:{order_id}"
+
+
+def _attach_products(orders):
+    """Give the orders' items their products from the identity map, loading
+    only the products the request has not seen yet."""
+    prefetch_related_objects(orders, "items")
+    field = OrderItem._meta.get_field("product")
+    items = [
+        item for order in orders for item in order.items.all() if not field.is_cached(item)
+    ]
+    products = current_identity_map().get_many(
+        Product, {item.product_id for item in items}
+    )
+    for item in items:
+        field.set_cached_value(item, products[item.product_id])
+
+
+def render_orders(orders):
+    """Return ``{order_id: payload}``, serializing (with one write) the orders
+    that have no stored snapshot yet, and cache the payloads."""
+    fresh = [order for order in orders if order.snapshot is None]
+    if fresh:
+        _attach_products(fresh)
+        for order in fresh:
+            order.snapshot = OrderSerializer(order).data
+        Order.objects.bulk_update(fresh, ["snapshot"])
+    data = {order.id: order.snapshot for order in orders}
+    cache.set_many(
+        {_key(order_id): payload for order_id, payload in data.items()},
+        settings.ORDER_CACHE_TTL,
+    )
+    return data
+
+
+def render_order(order):
+    return render_orders([order])[order.id]
+
+
+def get_cached_order(order_id):
+    return cache.get(_key(order_id))
+
+
+def get_cached_orders(order_ids):
+    found = cache.get_many([_key(order_id) for order_id in order_ids])
+    return {order_id: found[_key(order_id)] for order_id in order_ids if _key(order_id) in found}
+
+
+def forget_order(order_id):
+    cache.delete(_key(order_id))
+
+
+def etag_for(data):
+    payload = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True)
+    return f'"{hashlib.sha256(payload.encode()).hexdigest()[:32]}"'
+
+
+def conditional_response(request, data, cache_control):
+    etag = etag_for(data)
+    if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+    if etag in if_none_match or "*" in if_none_match:
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(data)
+    response["ETag"] = etag
+    response["Cache-Control"] = cache_control
+    return response
@@ -0,0 +1,74 @@
+"""Streaming export of order items, one row per item with its order's fields.
+
+Rows are read with ``QuerySet.iterator()`` (a server-side cursor on
+PostgreSQL) and written as they arrive, so memory use does not depend on the
+size of the date range.
+"""
+import csv
+import json
+from datetime import datetime, time, timedelta, timezone
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import OrderItem
+
+EXPORT_FIELDS = (
+    "order_id", "user_id", "created_at", "order_total", "product_id", "quantity", "price",
+)
+EXPORT_CONTENT_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+CHUNK_SIZE = 2000
+
+
+def export_rows(date_from=None, date_to=None):
+    """Yield item rows created between the two dates, both inclusive."""
+    items = OrderItem.objects.all()
+    if date_from:
+        items = items.filter(
+            created_at__gte=datetime.combine(date_from, time.min, timezone.utc)
+        )
+    if date_to:
+        items = items.filter(
+            created_at__lt=datetime.combine(
+                date_to + timedelta(days=1), time.min, timezone.utc
+            )
+        )
+    return items.order_by("order_id", "id").values_list(
+        "order_id", "order__user_id", "created_at", "order__total",
+        "product_id", "quantity", "price",
+    ).iterator(chunk_size=CHUNK_SIZE)
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def _csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow(
+            [value.isoformat() if isinstance(value, datetime) else value for value in row]
+        )
+
+
+def _ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_FIELDS, row)), cls=DjangoJSONEncoder) + "\n"
+
+
+def stream_export(output, date_from=None, date_to=None):
+    """Yield the export as text chunks in ``output`` format (csv or ndjson)."""
+    rows = export_rows(date_from, date_to)
+    lines = _csv_lines(rows) if output == "csv" else _ndjson_lines(rows)
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) == CHUNK_SIZE:
+            yield "".join(buffer)
+            buffer = []
+    if buffer:
+        yield "".join(buffer)
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from orders.partitions import (
+    add_months,
+    archive_partition,
+    is_partitioned,
+    month_start,
+    monthly_partitions,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Dump order partitions older than --keep-months to gzipped NDJSON files "
+        "and detach them (PostgreSQL only)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("output_dir")
+        parser.add_argument(
+            "--keep-months", type=int, default=12,
+            help="Number of past months, besides the current one, to keep online.",
+        )
+        parser.add_argument(
+            "--keep-tables", action="store_true",
+            help="Detach archived partitions without dropping them.",
+        )
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            raise CommandError("Orders are not partitioned on this database.")
+        if options["keep_months"] < 0:
+            raise CommandError("--keep-months cannot be negative.")
+
+        cutoff = add_months(month_start(timezone.now()), -options["keep_months"])
+        for month in monthly_partitions():
+            if month >= cutoff:
+                break
+            path, count = archive_partition(
+                month, options["output_dir"], drop=not options["keep_tables"]
+            )
+            self.stdout.write(f"Archived {count} orders from {month:%Y-%m} to {path}.")
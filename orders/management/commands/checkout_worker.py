@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.services import process_checkout_jobs
+
+
+class Command(BaseCommand):
+    help = "Process queued checkouts (CHECKOUT_ASYNC mode)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument(
+            "--sleep", type=float, default=1.0,
+            help="Seconds to wait before polling again when the queue is empty.",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Drain the queue once and exit."
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process_checkout_jobs(batch_size=options["batch_size"])
+            if processed:
+                self.stdout.write(f"Processed {processed} checkout jobs.")
+            elif options["once"]:
+                return
+            else:
+                time.sleep(options["sleep"])
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+from django.utils import timezone
+
+from orders.partitions import create_partitions, is_partitioned, month_start
+
+
+class Command(BaseCommand):
+    help = "Create monthly order partitions ahead of time (PostgreSQL only)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months", type=int, default=3,
+            help="Number of months after the current one to create.",
+        )
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            raise CommandError("Orders are not partitioned on this database.")
+        try:
+            months = create_partitions(
+                month_start(timezone.now()), options["months"] + 1
+            )
+        except DatabaseError as e:
+            raise CommandError(f"Could not create partitions: {e}")
+        self.stdout.write(
+            f"Order partitions exist through {months[-1]:%Y-%m}."
+        )
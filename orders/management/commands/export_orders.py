@@ -0,0 +1,28 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from orders.export import EXPORT_CONTENT_TYPES, stream_export
+
+
+class Command(BaseCommand):
+    help = "Stream order items as CSV or NDJSON to a file or stdout."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output", choices=sorted(EXPORT_CONTENT_TYPES), default="csv"
+        )
+        parser.add_argument("--from", dest="date_from", type=date.fromisoformat)
+        parser.add_argument("--to", dest="date_to", type=date.fromisoformat)
+        parser.add_argument("--file", help="Write to this path instead of stdout.")
+
+    def handle(self, *args, **options):
+        chunks = stream_export(
+            options["output"], options["date_from"], options["date_to"]
+        )
+        if options["file"]:
+            with open(options["file"], "w", newline="", encoding="utf-8") as out:
+                out.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending="")
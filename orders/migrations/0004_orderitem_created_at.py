@@ -0,0 +1,41 @@
+# Generated by Django 4.2 on 2026-10-17 00:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def copy_order_created_at(apps, schema_editor):
+    Order = apps.get_model("orders", "Order")
+    OrderItem = apps.get_model("orders", "OrderItem")
+    OrderItem.objects.update(
+        created_at=models.Subquery(
+            Order.objects.filter(pk=models.OuterRef("order_id")).values("created_at")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_order_user_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.RunPython(copy_order_created_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='checkoutjob',
+            name='order',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='orders.order'),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='order',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='items', to='orders.order'),
+        ),
+    ]
@@ -0,0 +1,110 @@
+import re
+from datetime import date
+
+from django.db import migrations
+from django.db.migrations.exceptions import IrreversibleError
+from django.utils import timezone
+
+# Migrations must not import application code, so the few helpers of
+# orders/partitions.py used here are copied as they were at this point.
+PARTITIONED_TABLES = ("orders_order", "orders_orderitem")
+
+# Months created past the current one; `manage.py create_order_partitions`
+# keeps extending this from cron.
+MONTHS_AHEAD = 3
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _bound(month):
+    return f"'{month:%Y-%m-%d} 00:00:00+00'"
+
+
+def create_partition(cursor, table, month):
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {table}_p{month:%Y_%m} PARTITION OF {table}"
+        f" FOR VALUES FROM ({_bound(month)}) TO ({_bound(add_months(month, 1))})"
+    )
+
+
+def _partition_table(cursor, table, first_month, last_month):
+    """Rebuild ``table`` as a partitioned copy of itself.
+
+    The rows are copied once, so this takes as long as a full table rewrite.
+    """
+    old = f"{table}_unpartitioned"
+    cursor.execute(f"ALTER TABLE {table} RENAME TO {old}")
+    cursor.execute(
+        f"CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        " PARTITION BY RANGE (created_at)"
+    )
+    cursor.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+    month = first_month
+    while month <= last_month:
+        create_partition(cursor, table, month)
+        month = add_months(month, 1)
+    cursor.execute(f"INSERT INTO {table} SELECT * FROM {old}")
+
+    cursor.execute(
+        "SELECT pg_get_indexdef(indexrelid) FROM pg_index"
+        " WHERE indrelid = %s::regclass AND NOT indisprimary",
+        [old],
+    )
+    indexes = [row[0] for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint"
+        " WHERE conrelid = %s::regclass AND contype = 'f'",
+        [old],
+    )
+    foreign_keys = cursor.fetchall()
+    cursor.execute(f"SELECT max(id) FROM {old}")
+    last_id = cursor.fetchone()[0]
+    cursor.execute(f"DROP TABLE {old}")
+
+    # The identity column does not survive LIKE; use an owned sequence.
+    cursor.execute(f"CREATE SEQUENCE {table}_id_seq OWNED BY {table}.id")
+    if last_id:
+        cursor.execute(f"SELECT setval('{table}_id_seq', %s)", [last_id])
+    cursor.execute(
+        f"ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{table}_id_seq')"
+    )
+    # Unique keys of a partitioned table must contain the partition key.
+    cursor.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id, created_at)")
+    for definition in indexes:
+        cursor.execute(re.sub(rf" ON (\S+\.)?{old} ", f" ON {table} ", definition))
+    for name, definition in foreign_keys:
+        cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+
+
+def partition_orders(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT min(created_at) FROM orders_order")
+        oldest = cursor.fetchone()[0] or timezone.now()
+        last_month = add_months(month_start(timezone.now()), MONTHS_AHEAD)
+        for table in PARTITIONED_TABLES:
+            _partition_table(cursor, table, month_start(oldest), last_month)
+
+
+def unpartition_orders(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        raise IrreversibleError("Order partitioning cannot be reverted automatically.")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_orderitem_created_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_orders, unpartition_orders),
+    ]
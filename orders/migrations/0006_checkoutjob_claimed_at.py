@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-17 01:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_partition_orders'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='checkoutjob',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
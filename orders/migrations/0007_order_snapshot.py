@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-17 01:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_checkoutjob_claimed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='snapshot',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
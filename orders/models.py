@@ -1,4 +1,5 @@
 from django.db import models, transaction
+from django.utils import timezone
 from products.models import Product
 from users.models import User
 
@@ -7,16 +8,68 @@ class Order(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     total = models.DecimalField(max_digits=10, decimal_places=2)
     created_at = models.DateTimeField(auto_now_add=True)
+    # The API representation as first rendered, see orders/cache.py.
+    snapshot = models.JSONField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "-created_at", "-id"], name="order_user_created_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"Order #{self.id}"
 
 
+# On PostgreSQL orders and their items are range-partitioned by created_at
+# (see orders/partitions.py). The primary keys of partitioned tables include
+# created_at, so foreign keys to Order cannot be enforced by the database.
 class OrderItem(models.Model):
-    order = models.ForeignKey(Order, related_name="items", on_delete=models.CASCADE)
+    order = models.ForeignKey(
+        Order, related_name="items", on_delete=models.CASCADE, db_constraint=False
+    )
     quantity = models.PositiveIntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     product = models.ForeignKey(Product, on_delete=models.PROTECT)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    def save(self, *args, **kwargs):
+        # Keep the item in its order's partition; bulk_create callers pass
+        # created_at=order.created_at themselves.
+        if self._state.adding and self.order_id is not None:
+            self.created_at = self.order.created_at
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"OrderItem #{self.id}"
+
+
+class CheckoutJob(models.Model):
+    class Status(models.TextChoices):
+        PENDING = "pending"
+        PROCESSING = "processing"
+        COMPLETED = "completed"
+        FAILED = "failed"
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    status = models.CharField(
+        max_length=16, choices=Status.choices, default=Status.PENDING
+    )
+    order = models.ForeignKey(
+        Order, null=True, blank=True, on_delete=models.SET_NULL, db_constraint=False
+    )
+    error = models.JSONField(null=True, blank=True)
+    # When a worker took the job; a PROCESSING job whose claim is older than
+    # CHECKOUT_JOB_LEASE belongs to a dead worker and is claimed again.
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "created_at"], name="checkout_job_queue_idx"),
+        ]
+
+    def __str__(self):
+        return f"CheckoutJob #{self.id} ({self.status})"
@@ -0,0 +1,149 @@
+"""Monthly range partitions of orders and order items on PostgreSQL.
+
+Both tables are partitioned by ``created_at`` (migration 0005) into
+``<table>_pYYYY_MM`` partitions plus a ``<table>_default`` catch-all.
+``manage.py create_order_partitions`` creates upcoming months ahead of time and
+``manage.py archive_order_partitions`` dumps old months to gzipped NDJSON
+files and detaches them.
+"""
+import gzip
+import json
+import re
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+
+from .cache import forget_order
+from .models import CheckoutJob, Order
+
+PARTITIONED_TABLES = ("orders_order", "orders_orderitem")
+
+_PARTITION_SUFFIX = re.compile(r"_p(\d{4})_(\d{2})$")
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_range(month):
+    """Return the aware UTC datetimes bounding ``month``."""
+    return (
+        datetime(month.year, month.month, 1, tzinfo=timezone.utc),
+        datetime.combine(add_months(month, 1), datetime.min.time(), timezone.utc),
+    )
+
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y_%m}"
+
+
+def is_partitioned(table="orders_order"):
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table"
+            " WHERE partrelid = to_regclass(%s))",
+            [table],
+        )
+        return cursor.fetchone()[0]
+
+
+def _bound(month):
+    return f"'{month:%Y-%m-%d} 00:00:00+00'"
+
+
+def create_partition(cursor, table, month):
+    """Create the partition of ``table`` for ``month`` unless it exists."""
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)}"
+        f" PARTITION OF {table}"
+        f" FOR VALUES FROM ({_bound(month)}) TO ({_bound(add_months(month, 1))})"
+    )
+
+
+def monthly_partitions(table="orders_order"):
+    """Return the months that have a partition of ``table``, oldest first."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT inhrelid::regclass::text FROM pg_inherits"
+            " WHERE inhparent = to_regclass(%s)",
+            [table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    months = []
+    for name in names:
+        match = _PARTITION_SUFFIX.search(name)
+        if match:
+            months.append(date(int(match[1]), int(match[2]), 1))
+    return sorted(months)
+
+
+@transaction.atomic
+def create_partitions(first_month, count):
+    created = []
+    with connection.cursor() as cursor:
+        for offset in range(count):
+            month = add_months(first_month, offset)
+            for table in PARTITIONED_TABLES:
+                create_partition(cursor, table, month)
+            created.append(month)
+    return created
+
+
+def _archived_orders(month):
+    start, end = month_range(month)
+    orders = (
+        Order.objects.filter(created_at__gte=start, created_at__lt=end)
+        .prefetch_related("items")
+        .order_by("id")
+    )
+    for order in orders.iterator(chunk_size=2000):
+        yield {
+            "id": order.id,
+            "user_id": order.user_id,
+            "total": order.total,
+            "created_at": order.created_at,
+            "items": [
+                {
+                    "product_id": item.product_id,
+                    "quantity": item.quantity,
+                    "price": item.price,
+                }
+                for item in order.items.all()
+            ],
+        }
+
+
+def archive_partition(month, directory, drop=True):
+    """Write the orders of ``month`` to ``<directory>/orders_YYYY_MM.ndjson.gz``,
+    then detach (and by default drop) its partitions.
+
+    Returns the archive path and the number of archived orders.
+    """
+    path = Path(directory) / f"orders_{month:%Y_%m}.ndjson.gz"
+    count = 0
+    with gzip.open(path, "wt", encoding="utf-8") as archive:
+        for record in _archived_orders(month):
+            archive.write(json.dumps(record, cls=DjangoJSONEncoder) + "\n")
+            forget_order(record["id"])
+            count += 1
+
+    start, end = month_range(month)
+    with transaction.atomic(), connection.cursor() as cursor:
+        CheckoutJob.objects.filter(
+            order__created_at__gte=start, order__created_at__lt=end
+        ).update(order=None)
+        for table in reversed(PARTITIONED_TABLES):
+            partition = partition_name(table, month)
+            cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {partition}")
+            if drop:
+                cursor.execute(f"DROP TABLE {partition}")
+    return path, count
@@ -1,8 +1,9 @@
 from rest_framework import serializers
-from .models import Order, OrderItem
+from .models import CheckoutJob, Order, OrderItem
 from products.serializers import ProductSerializer  # Предполагается, что ProductSerializer существует
+from store.fieldsets import SparseFieldsetMixin
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
 
     class Meta:
@@ -10,10 +11,51 @@ class OrderItemSerializer(serializers.ModelSerializer):
         fields = ['product', 'quantity', 'price']
         read_only_fields = ['product', 'quantity', 'price']
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
 
     class Meta:
         model = Order
         fields = ['id', 'user', 'created_at', 'total', 'items']
         read_only_fields = ['id', 'user', 'created_at', 'total', 'items']
+
+
+class CheckoutJobSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    order = OrderSerializer(read_only=True)
+
+    class Meta:
+        model = CheckoutJob
+        fields = ['id', 'status', 'order', 'error', 'created_at', 'updated_at']
+        read_only_fields = fields
+
+
+class OrderLineSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+
+class BatchOrderSerializer(serializers.Serializer):
+    items = OrderLineSerializer(many=True, allow_empty=False)
+
+    def validate_items(self, items):
+        quantities = {}
+        for line in items:
+            quantities[line["product_id"]] = (
+                quantities.get(line["product_id"], 0) + line["quantity"]
+            )
+        return quantities
+
+
+class OrderBatchSerializer(serializers.Serializer):
+    orders = BatchOrderSerializer(many=True, allow_empty=False, max_length=500)
+
+
+class OrderExportSerializer(serializers.Serializer):
+    output = serializers.ChoiceField(choices=["csv", "ndjson"], default="csv")
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        if attrs.get("date_from") and attrs.get("date_to") and attrs["date_from"] > attrs["date_to"]:
+            raise serializers.ValidationError("date_from must not be after date_to.")
+        return attrs
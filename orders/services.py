@@ -1,76 +1,438 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Q, Value, When
+from django.utils import timezone
 from rest_framework.exceptions import ValidationError
 import logging
-from cart.services import get_cart
-from products.models import Product
-from .models import Order, OrderItem
+import time
+from cart.models import CartItem, StockReservation
+from cart.services import forget_cart, get_cart, locked_cart, sync_cart
+from products.cache import bump_catalog_version
+from products.inventory import sharded_stock, take_sharded_stock
+from products.models import Product, StockShard
+from store.identity import current_identity_map, identity_map
+from store.transactions import retry_on_conflict
+from .cache import render_order
+from .models import CheckoutJob, Order, OrderItem
 from users.models import User
 
 logger = logging.getLogger(__name__)
 
-@transaction.atomic
-def create_order_from_cart(user):
-    user_cart = get_cart(user)
 
-    if not user_cart.exists():
-        raise ValidationError({"detail": ["Cart can't be empty"]})
+def _stock_after_decrement(quantities):
+    return F("stock") - Case(
+        *[When(id=pid, then=Value(qty)) for pid, qty in quantities.items()],
+        output_field=PositiveIntegerField(),
+    )
 
 
-    product_ids = [item.product.id for item in user_cart]
-    products = Product.objects.filter(id__in=product_ids).select_for_update()
-    products_map = {p.id: p for p in products}
+def _decrement_stock(quantities):
+    """Subtract ``{product_id: quantity}`` from stock with a single UPDATE."""
+    Product.objects.filter(id__in=quantities.keys()).update(
+        stock=_stock_after_decrement(quantities)
+    )
 
-    insuff_stock = []
-    total = 0
 
-    for item in user_cart:
-        prod = products_map.get(item.product.id)
+def _empty_cart_error():
+    return ValidationError({"detail": ["Cart can't be empty"]})
 
-        if not prod or item.quantity > prod.stock:
-            insuff_stock.append({
-                "product_id": prod.id if prod else item.product.id,
-                "requested": item.quantity,
-                "available": prod.stock if prod else 0,
-            })
-            continue
 
-        total += item.quantity * prod.price
+def _insufficient_stock_error(quantities, shortfalls):
+    insuff_stock = [
+        {
+            "product_id": product_id,
+            "requested": quantities[product_id],
+            "available": available,
+        }
+        for product_id, available in shortfalls.items()
+    ]
+    return ValidationError({
+        "detail": "Insufficient stock",
+        "products": insuff_stock
+    })
 
-    if insuff_stock:
-        raise ValidationError({
-            "detail": "Insufficient stock",
-            "products": insuff_stock
-        })
 
+def _insufficient_balance_error(total, balance):
+    return ValidationError({"detail": f"Insufficient balance {total - balance} more needed"})
+
+
+def _take_stock_locking(quantities):
+    if not quantities:
+        return {}, {}
+    products_map = current_identity_map().lock(Product, quantities.keys())
+
+    shortfalls = {}
+    for pid, qty in quantities.items():
+        available = products_map[pid].stock if pid in products_map else 0
+        if qty > available:
+            shortfalls[pid] = available
+
+    if not shortfalls:
+        _decrement_stock(quantities)
+    return {pid: p.price for pid, p in products_map.items()}, shortfalls
+
+
+def _take_sharded_stock(quantities, shard_counts):
+    shortfalls = {}
+    for pid, shard_count in shard_counts.items():
+        if not take_sharded_stock(pid, shard_count, quantities[pid]):
+            shortfalls[pid] = sharded_stock(pid)
+    return shortfalls
+
+
+def _charge_locking(user, total):
     locked_user = User.objects.select_for_update().get(pk=user.pk)
     if locked_user.balance < total:
-        raise ValidationError({"detail": f"Insufficient balance {total - locked_user.balance} more needed"})
+        raise _insufficient_balance_error(total, locked_user.balance)
+
+    locked_user.balance -= total
+    locked_user.save(update_fields=["balance"])
+
+
+def _take_stock_optimistic(quantities):
+    if not quantities:
+        return {}, {}
+    covered = Q()
+    for pid, qty in quantities.items():
+        covered |= Q(id=pid, stock__gte=qty)
+
+    # A partial UPDATE is rolled back before stock is re-read, so products
+    # that had enough are not reported short.
+    sid = transaction.savepoint()
+    updated = Product.objects.filter(covered).update(
+        stock=_stock_after_decrement(quantities)
+    )
+    if updated == len(quantities):
+        transaction.savepoint_commit(sid)
+        return {}, {}
+
+    transaction.savepoint_rollback(sid)
+    available = dict(
+        Product.objects.filter(id__in=quantities.keys()).values_list("id", "stock")
+    )
+    return {}, {
+        pid: available.get(pid, 0)
+        for pid, qty in quantities.items()
+        if qty > available.get(pid, 0)
+    }
+
+
+def _charge_optimistic(user, total):
+    updated = User.objects.filter(pk=user.pk, balance__gte=total).update(
+        balance=F("balance") - total
+    )
+    if not updated:
+        balance = User.objects.values_list("balance", flat=True).get(pk=user.pk)
+        raise _insufficient_balance_error(total, balance)
+
+
+CHECKOUT_STRATEGIES = {
+    "locking": (_take_stock_locking, _charge_locking),
+    "optimistic": (_take_stock_optimistic, _charge_optimistic),
+}
+
+
+def _get_checkout_strategy():
+    try:
+        return CHECKOUT_STRATEGIES[settings.CHECKOUT_STRATEGY]
+    except KeyError:
+        raise ImproperlyConfigured(
+            f"Unknown CHECKOUT_STRATEGY {settings.CHECKOUT_STRATEGY!r}, "
+            f"expected one of {sorted(CHECKOUT_STRATEGIES)}."
+        )
+
+
+def _sync_stock(products, taken):
+    """Apply a stock decrement to the loaded instances, which the order
+    response renders."""
+    for pid, qty in taken.items():
+        if pid in products and not products[pid].stock_shards:
+            products[pid].stock -= qty
+
+
+def create_order_from_cart(user):
+    # Held until the cart is forgotten after commit, so that a cart write-back
+    # cannot put the ordered lines back.
+    with locked_cart(user):
+        return _checkout_cart(user)
+
+
+@retry_on_conflict
+@identity_map()
+@transaction.atomic
+def _checkout_cart(user):
+    started = time.monotonic()
+    take_stock, charge = _get_checkout_strategy()
+    sync_cart(user)
+    # The lines are locked so that the order, its total and the lines deleted
+    # below all come from the same rows; they come first in the lock order of
+    # store/transactions.py.
+    cart_items = list(get_cart(user).select_for_update(of=("self",)))
+
+    if not cart_items:
+        raise _empty_cart_error()
+    identity = current_identity_map()
+    identity.add(*(item.product for item in cart_items))
+
+    quantities = {item.product_id: item.quantity for item in cart_items}
+    prices = {item.product_id: item.product.price for item in cart_items}
+    shard_counts = {
+        item.product_id: item.product.stock_shards
+        for item in cart_items
+        if item.product.stock_shards
+    }
+
+    # Units the user already holds were taken from stock when they were
+    # reserved; only the rest still has to be taken now.
+    covered = {}
+    if settings.STOCK_RESERVATIONS:
+        covered = StockReservation.objects.convert(user, quantities)
+    to_take = {
+        pid: qty - covered.get(pid, 0)
+        for pid, qty in quantities.items()
+        if qty > covered.get(pid, 0)
+    }
+
+    locked_prices, shortfalls = take_stock(
+        {pid: qty for pid, qty in to_take.items() if pid not in shard_counts}
+    )
+    prices.update(locked_prices)
+    shortfalls.update(_take_sharded_stock(to_take, {
+        pid: count for pid, count in shard_counts.items() if pid in to_take
+    }))
+    if shortfalls:
+        raise _insufficient_stock_error(quantities, {
+            pid: available + covered.get(pid, 0)
+            for pid, available in shortfalls.items()
+        })
+    _sync_stock(identity.get_many(Product, to_take), to_take)
+    bump_catalog_version()
+
+    total = sum(prices[pid] * qty for pid, qty in quantities.items())
+    charge(user, total)
 
     order = Order.objects.create(
-        user=locked_user,
+        user=user,
         total=total,
     )
 
-    for item in user_cart:
-        prod = products_map.get(item.product.id)
-        if not prod or item.quantity > prod.stock:
-            continue
-        OrderItem.objects.create(
+    OrderItem.objects.bulk_create([
+        OrderItem(
             order=order,
-            product=prod,
-            quantity=item.quantity,
-            price=prod.price,
+            product_id=product_id,
+            quantity=quantity,
+            price=prices[product_id],
+            created_at=order.created_at,
         )
-        prod.stock -= item.quantity
-        prod.save(update_fields=["stock"])
+        for product_id, quantity in quantities.items()
+    ])
 
-    locked_user.balance -= total
+    CartItem.objects.filter(pk__in=[item.pk for item in cart_items]).delete()
+    transaction.on_commit(lambda: forget_cart(user))
+
+    transaction.on_commit(lambda: logger.info(
+        "Order created",
+        extra={
+            "order_id": order.id,
+            "user": user.username,
+            "total": total,
+            "lines": len(quantities),
+            "duration_ms": round((time.monotonic() - started) * 1000, 1),
+        },
+    ))
+    return order
+
+
+def _lock_batch_stock(product_ids):
+    """Lock the products (and shards of sharded ones) and return them with
+    their available stock."""
+    products = current_identity_map().lock(Product, product_ids)
+    stock = {pid: product.stock for pid, product in products.items()}
+    sharded = [pid for pid, product in products.items() if product.stock_shards]
+    if sharded:
+        stock.update(dict.fromkeys(sharded, 0))
+        shards = (
+            StockShard.objects.filter(product_id__in=sharded)
+            .order_by("product_id", "index")
+            .select_for_update()
+            .values_list("product_id", "stock")
+        )
+        for pid, shard_stock in shards:
+            stock[pid] += shard_stock
+    return products, stock
+
+
+@retry_on_conflict
+@identity_map()
+@transaction.atomic
+def create_orders_batch(user, batch):
+    """Place each order of ``batch``, a list of ``{product_id: quantity}``,
+    that the remaining stock and balance cover, all in one transaction.
+
+    Returns one ``(order, errors)`` pair per entry, in order.
+    """
+    started = time.monotonic()
+    products, stock = _lock_batch_stock(set().union(*batch))
+    locked_user = User.objects.select_for_update().get(pk=user.pk)
+
+    results, placed, taken = [], [], {}
+    for quantities in batch:
+        unknown = sorted(quantities.keys() - products.keys())
+        if unknown:
+            results.append((None, {"detail": "No such product.", "products": unknown}))
+            continue
+
+        shortfalls = {
+            pid: stock[pid] - taken.get(pid, 0)
+            for pid, qty in quantities.items()
+            if qty > stock[pid] - taken.get(pid, 0)
+        }
+        if shortfalls:
+            results.append((None, _insufficient_stock_error(quantities, shortfalls).detail))
+            continue
+
+        total = sum(products[pid].price * qty for pid, qty in quantities.items())
+        if total > locked_user.balance:
+            results.append(
+                (None, _insufficient_balance_error(total, locked_user.balance).detail)
+            )
+            continue
+
+        locked_user.balance -= total
+        for pid, qty in quantities.items():
+            taken[pid] = taken.get(pid, 0) + qty
+        order = Order(user=user, total=total)
+        placed.append((order, quantities))
+        results.append((order, None))
+
+    if not placed:
+        return results
+
+    bump_catalog_version()
+    plain = {pid: qty for pid, qty in taken.items() if not products[pid].stock_shards}
+    if plain:
+        _decrement_stock(plain)
+        _sync_stock(products, plain)
+    for pid, qty in taken.items():
+        if products[pid].stock_shards:
+            take_sharded_stock(pid, products[pid].stock_shards, qty)
     locked_user.save(update_fields=["balance"])
 
+    Order.objects.bulk_create([order for order, _ in placed])
+    OrderItem.objects.bulk_create([
+        OrderItem(
+            order=order,
+            product_id=product_id,
+            quantity=quantity,
+            price=products[product_id].price,
+            created_at=order.created_at,
+        )
+        for order, quantities in placed
+        for product_id, quantity in quantities.items()
+    ])
+
+    transaction.on_commit(lambda: logger.info(
+        "Order batch created",
+        extra={
+            "user": user.username,
+            "orders": len(placed),
+            "failed": len(results) - len(placed),
+            "total": sum(order.total for order, _ in placed),
+            "duration_ms": round((time.monotonic() - started) * 1000, 1),
+        },
+    ))
+    return results
 
-    user_cart.delete()
 
-    logger.info(
-        f"Order #{order.id} created by {locked_user.username} successfully (total {total})."
-    )
-    return order
+def enqueue_checkout(user):
+    """Queue a checkout of the user's cart. The worker orders the cart as it
+    is when the job runs, including changes made after it was queued."""
+    sync_cart(user)
+    if not get_cart(user).exists():
+        raise _empty_cart_error()
+    return CheckoutJob.objects.create(user=user)
+
+
+def _claim_checkout_jobs(batch_size):
+    """Claim pending jobs and jobs whose worker let its lease expire."""
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            CheckoutJob.objects.select_for_update(skip_locked=True)
+            .select_related("user")
+            .filter(
+                Q(status=CheckoutJob.Status.PENDING)
+                | Q(
+                    status=CheckoutJob.Status.PROCESSING,
+                    claimed_at__lt=now - settings.CHECKOUT_JOB_LEASE,
+                )
+            )
+            .order_by("created_at")[:batch_size]
+        )
+        CheckoutJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            status=CheckoutJob.Status.PROCESSING, claimed_at=now
+        )
+    for job in jobs:
+        job.status, job.claimed_at = CheckoutJob.Status.PROCESSING, now
+    return jobs
+
+
+def _still_claimed(job):
+    """Lock the job row, returning False when another worker has taken it over."""
+    return CheckoutJob.objects.select_for_update().filter(
+        pk=job.pk, status=CheckoutJob.Status.PROCESSING, claimed_at=job.claimed_at
+    ).exists()
+
+
+def _group_by_products(jobs):
+    """Order jobs so that checkouts touching the same products run back to back."""
+    carts = {}
+    cart_products = CartItem.objects.filter(
+        user_id__in={job.user_id for job in jobs}
+    ).values_list("user_id", "product_id")
+    for user_id, product_id in cart_products:
+        carts.setdefault(user_id, []).append(product_id)
+    return sorted(jobs, key=lambda job: (sorted(carts.get(job.user_id, [])), job.created_at))
+
+
+@retry_on_conflict
+@transaction.atomic
+def _checkout_job(job):
+    """Check out the job's cart and record the outcome in one transaction, so
+    a worker that dies midway leaves the job to be claimed again."""
+    if not _still_claimed(job):
+        return
+    try:
+        job.order = create_order_from_cart(job.user)
+    except ValidationError as e:
+        job.status = CheckoutJob.Status.FAILED
+        job.error = e.detail
+    else:
+        job.status = CheckoutJob.Status.COMPLETED
+        order = job.order
+        transaction.on_commit(lambda: render_order(order))
+    job.save(update_fields=["status", "order", "error", "updated_at"])
+
+
+def _run_checkout_job(job):
+    try:
+        with locked_cart(job.user):
+            _checkout_job(job)
+    except Exception:
+        logger.exception("Checkout job crashed", extra={"job_id": job.id})
+        CheckoutJob.objects.filter(
+            pk=job.pk, status=CheckoutJob.Status.PROCESSING, claimed_at=job.claimed_at
+        ).update(
+            status=CheckoutJob.Status.FAILED,
+            order=None,
+            error={"detail": "Checkout failed, please try again."},
+            updated_at=timezone.now(),
+        )
+
+
+def process_checkout_jobs(batch_size=50):
+    jobs = _claim_checkout_jobs(batch_size)
+    for job in _group_by_products(jobs):
+        _run_checkout_job(job)
+    return len(jobs)
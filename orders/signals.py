@@ -0,0 +1,15 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import forget_order
+from .models import Order, OrderItem
+
+
+@receiver([post_save, post_delete], sender=Order)
+def forget_cached_order(sender, instance, **kwargs):
+    forget_order(instance.id)
+
+
+@receiver([post_save, post_delete], sender=OrderItem)
+def forget_cached_order_of_item(sender, instance, **kwargs):
+    forget_order(instance.order_id)
@@ -1,6 +1,14 @@
+import json
 import uuid
+from datetime import date, timedelta
 from decimal import Decimal
-from django.test import TestCase
+from io import StringIO
+from unittest import mock, skipIf, skipUnless
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.utils import timezone
 from rest_framework.test import APITestCase
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
@@ -8,8 +16,24 @@ from django.urls import reverse
 from users.models import User
 from products.models import Product
 from cart.models import CartItem
-from orders.models import Order, OrderItem
-from orders.services import create_order_from_cart
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from orders.cache import render_order
+from orders.models import CheckoutJob, Order, OrderItem
+from orders.partitions import (
+    PARTITIONED_TABLES,
+    add_months,
+    is_partitioned,
+    month_range,
+    month_start,
+    monthly_partitions,
+    partition_name,
+)
+from orders.services import (
+    CHECKOUT_STRATEGIES,
+    create_order_from_cart,
+    process_checkout_jobs,
+)
 from orders.serializers import OrderSerializer, OrderItemSerializer
 
 
@@ -243,6 +267,150 @@ class CreateOrderFromCartTests(TestCase):
 
         self.assertFalse(CartItem.objects.filter(user=self.user).exists())
 
+    def test_total_comes_from_the_ordered_lines(self):
+        product2 = Product.objects.create(
+            name="Test Product 2", price=Decimal("15.00"), stock=3
+        )
+        CartItem.objects.create(user=self.user, product=self.product, quantity=2)
+        take_stock, charge = CHECKOUT_STRATEGIES["locking"]
+
+        def take_stock_while_cart_changes(quantities):
+            # A line added after the cart was loaded is not part of this order.
+            CartItem.objects.create(user=self.user, product=product2, quantity=1)
+            return take_stock(quantities)
+
+        with mock.patch.dict(
+            CHECKOUT_STRATEGIES, {"locking": (take_stock_while_cart_changes, charge)}
+        ):
+            order = create_order_from_cart(self.user)
+
+        self.assertEqual(order.total, Decimal("20.00"))
+        self.assertEqual(
+            order.total, sum(item.price * item.quantity for item in order.items.all())
+        )
+        self.assertEqual(
+            list(CartItem.objects.filter(user=self.user).values_list("product_id", flat=True)),
+            [product2.id],
+        )
+
+    def test_order_is_logged_after_commit(self):
+        CartItem.objects.create(user=self.user, product=self.product, quantity=2)
+        with self.assertLogs("orders.services", "INFO") as logs:
+            with self.captureOnCommitCallbacks() as callbacks:
+                order = create_order_from_cart(self.user)
+            self.assertEqual(logs.records, [])
+            for callback in callbacks:
+                callback()
+
+        record = logs.records[0]
+        self.assertEqual(record.order_id, order.id)
+        self.assertEqual(record.user, self.user.username)
+        self.assertEqual(record.total, Decimal("20.00"))
+        self.assertEqual(record.lines, 1)
+
+    def test_checkout_query_count_does_not_grow_with_cart(self):
+        CartItem.objects.create(user=self.user, product=self.product, quantity=1)
+        with self.assertNumQueries(10):
+            create_order_from_cart(self.user)
+
+        self.user.balance = Decimal("1000.00")
+        self.user.save()
+        for i in range(20):
+            product = Product.objects.create(
+                name=f"Bulk Product {i}", price=Decimal("1.50"), stock=10
+            )
+            CartItem.objects.create(user=self.user, product=product, quantity=2)
+        with self.assertNumQueries(10):
+            order = create_order_from_cart(self.user)
+
+        self.assertEqual(order.total, Decimal("60.00"))
+        self.assertEqual(order.items.count(), 20)
+        self.assertFalse(Product.objects.filter(name__startswith="Bulk", stock=10).exists())
+
+
+@override_settings(CHECKOUT_STRATEGY="optimistic")
+class OptimisticCheckoutTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username=f"testuser_{uuid.uuid4().hex[:8]}",
+            email=f"test_{uuid.uuid4().hex[:8]}@example.com",
+            password="password123",
+            balance=Decimal("100.00"),
+        )
+        self.product = Product.objects.create(
+            name="Test Product", price=Decimal("10.00"), stock=5
+        )
+        self.product2 = Product.objects.create(
+            name="Test Product 2", price=Decimal("15.00"), stock=3
+        )
+
+    def test_successful_order(self):
+        CartItem.objects.create(user=self.user, product=self.product, quantity=2)
+        CartItem.objects.create(user=self.user, product=self.product2, quantity=1)
+        with self.assertNumQueries(10):
+            order = create_order_from_cart(self.user)
+
+        self.assertEqual(order.total, Decimal("35.00"))
+        self.assertEqual(order.items.count(), 2)
+        self.product.refresh_from_db()
+        self.product2.refresh_from_db()
+        self.assertEqual(self.product.stock, 3)
+        self.assertEqual(self.product2.stock, 2)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal("65.00"))
+        self.assertFalse(CartItem.objects.filter(user=self.user).exists())
+
+    def test_insufficient_stock_keeps_payload_and_rolls_back(self):
+        CartItem.objects.create(user=self.user, product=self.product, quantity=2)
+        CartItem.objects.create(user=self.user, product=self.product2, quantity=4)
+        with self.assertRaises(ValidationError) as ctx:
+            create_order_from_cart(self.user)
+
+        self.assertEqual(ctx.exception.detail["detail"], "Insufficient stock")
+        self.assertEqual(len(ctx.exception.detail["products"]), 1)
+        insuff_product = ctx.exception.detail["products"][0]
+        self.assertEqual(int(insuff_product["product_id"]), self.product2.id)
+        self.assertEqual(int(insuff_product["requested"]), 4)
+        self.assertEqual(int(insuff_product["available"]), 3)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+        self.assertEqual(CartItem.objects.filter(user=self.user).count(), 2)
+
+    def test_only_short_products_are_reported(self):
+        # product has enough stock and is decremented by the conditional
+        # UPDATE; the shortfall report must still see its stock before it.
+        CartItem.objects.create(user=self.user, product=self.product, quantity=4)
+        CartItem.objects.create(user=self.user, product=self.product2, quantity=4)
+        with self.assertRaises(ValidationError) as ctx:
+            create_order_from_cart(self.user)
+
+        self.assertEqual(
+            [
+                (int(p["product_id"]), int(p["requested"]), int(p["available"]))
+                for p in ctx.exception.detail["products"]
+            ],
+            [(self.product2.id, 4, 3)],
+        )
+
+    def test_insufficient_balance_rolls_back_stock(self):
+        CartItem.objects.create(user=self.user, product=self.product, quantity=4)
+        self.user.balance = Decimal("30.00")
+        self.user.save()
+        with self.assertRaises(ValidationError) as ctx:
+            create_order_from_cart(self.user)
+
+        self.assertIn("10.00 more needed", ctx.exception.detail.get("detail", []))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+        self.assertFalse(Order.objects.exists())
+
+    def test_check_constraints_reject_negative_values(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Product.objects.filter(pk=self.product.pk).update(stock=F("stock") - 6)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.filter(pk=self.user.pk).update(balance=F("balance") - 101)
+
 
 class OrderCreateViewTests(APITestCase):
     def setUp(self):
@@ -338,6 +506,20 @@ class OrderCreateViewTests(APITestCase):
         }
         self.assertEqual(response.data, expected_data)
 
+    def test_response_reuses_checkout_products(self):
+        self.auth()
+        self.user.balance = Decimal("1000.00")
+        self.user.save()
+        for i in range(5):
+            product = Product.objects.create(
+                name=f"Bulk Product {i}", price=Decimal("1.00"), stock=10
+            )
+            CartItem.objects.create(user=self.user, product=product, quantity=1)
+        with self.assertNumQueries(13):
+            response = self.client.post(self.url)
+        self.assertEqual(len(response.data["items"]), 5)
+        self.assertEqual(response.data["items"][0]["product"]["stock"], 9)
+
     def test_successful_order_creation_multiple_items(self):
         self.auth()
         product2 = Product.objects.create(
@@ -397,3 +579,576 @@ class OrderCreateViewTests(APITestCase):
             ],
         }
         self.assertEqual(response.data, expected_data)
+
+
+@override_settings(CHECKOUT_ASYNC=True)
+class AsyncCheckoutTests(APITestCase):
+    def setUp(self):
+        self.url = reverse("create-order")
+        self.user = User.objects.create_user(
+            username=f"testuser_{uuid.uuid4().hex[:8]}",
+            email=f"test_{uuid.uuid4().hex[:8]}@example.com",
+            password="password123",
+            balance=Decimal("100.00"),
+        )
+        self.product = Product.objects.create(
+            name="Test Product", price=Decimal("10.00"), stock=5
+        )
+        response = self.client.post(
+            "/api/user/token/",
+            {"username": self.user.username, "password": "password123"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK, msg=response.content)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + response.data["access"])
+
+    def test_create_enqueues_job(self):
+        CartItem.objects.create(user=self.user, product=self.product, quantity=2)
+        response = self.client.post(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data["status"], "pending")
+        self.assertEqual(
+            response["Location"], reverse("checkout-job", args=[response.data["id"]])
+        )
+        self.assertFalse(Order.objects.exists())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+
+    def test_empty_cart_rejected_before_enqueue(self):
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("Cart can't be empty", str(response.data))
+        self.assertFalse(CheckoutJob.objects.exists())
+
+    def test_worker_completes_job(self):
+        CartItem.objects.create(user=self.user, product=self.product, quantity=2)
+        job_url = self.client.post(self.url)["Location"]
+
+        call_command("checkout_worker", once=True, stdout=StringIO())
+
+        response = self.client.get(job_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["status"], "completed")
+        self.assertEqual(response.data["order"]["total"], "20.00")
+        self.assertIsNone(response.data["error"])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 3)
+
+    def test_completed_job_serves_order_snapshot(self):
+        CartItem.objects.create(user=self.user, product=self.product, quantity=2)
+        job_url = self.client.post(self.url)["Location"]
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("checkout_worker", once=True, stdout=StringIO())
+        order = Order.objects.get()
+        Product.objects.filter(pk=self.product.pk).update(name="Renamed")
+
+        response = self.client.get(job_url)
+        self.assertEqual(response.data["order"], self.client.get(reverse("order-detail", args=[order.id])).data)
+        self.assertEqual(response.data["order"]["items"][0]["product"]["name"], "Test Product")
+
+        response = self.client.get(job_url, {"fields": "status,order.total"})
+        self.assertEqual(response.data, {"status": "completed", "order": {"total": "20.00"}})
+
+    def test_worker_records_failure(self):
+        CartItem.objects.create(user=self.user, product=self.product, quantity=2)
+        job_url = self.client.post(self.url)["Location"]
+        Product.objects.filter(pk=self.product.pk).update(stock=1)
+
+        self.assertEqual(process_checkout_jobs(), 1)
+
+        response = self.client.get(job_url)
+        self.assertEqual(response.data["status"], "failed")
+        self.assertIsNone(response.data["order"])
+        self.assertEqual(response.data["error"]["detail"], "Insufficient stock")
+        self.assertEqual(int(response.data["error"]["products"][0]["available"]), 1)
+
+    def test_expired_claim_is_taken_over(self):
+        CartItem.objects.create(user=self.user, product=self.product, quantity=2)
+        stale = timezone.now() - settings.CHECKOUT_JOB_LEASE - timedelta(seconds=1)
+        job = CheckoutJob.objects.create(
+            user=self.user, status=CheckoutJob.Status.PROCESSING, claimed_at=stale
+        )
+        live = CheckoutJob.objects.create(
+            user=self.user, status=CheckoutJob.Status.PROCESSING, claimed_at=timezone.now()
+        )
+
+        self.assertEqual(process_checkout_jobs(), 1)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, CheckoutJob.Status.COMPLETED)
+        self.assertEqual(job.order.total, Decimal("20.00"))
+        live.refresh_from_db()
+        self.assertEqual(live.status, CheckoutJob.Status.PROCESSING)
+
+    def test_crash_leaves_no_half_finished_job(self):
+        CartItem.objects.create(user=self.user, product=self.product, quantity=2)
+        job = CheckoutJob.objects.create(user=self.user)
+
+        with mock.patch.object(
+            CheckoutJob, "save", side_effect=RuntimeError("worker died")
+        ), self.assertLogs("orders.services", "ERROR"):
+            process_checkout_jobs()
+
+        # The order was rolled back together with the job update.
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(CartItem.objects.filter(user=self.user).count(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, CheckoutJob.Status.FAILED)
+
+    def test_jobs_sharing_products_run_back_to_back(self):
+        other = Product.objects.create(name="Other", price=Decimal("1.00"), stock=50)
+        buyers = []
+        for product in [self.product, other, self.product]:
+            buyer = User.objects.create_user(
+                username=f"buyer_{uuid.uuid4().hex[:8]}",
+                password="password123",
+                balance=Decimal("100.00"),
+            )
+            CartItem.objects.create(user=buyer, product=product, quantity=1)
+            CheckoutJob.objects.create(user=buyer)
+            buyers.append(buyer)
+
+        process_checkout_jobs()
+
+        order_users = list(Order.objects.order_by("id").values_list("user_id", flat=True))
+        self.assertEqual(order_users, [buyers[0].id, buyers[2].id, buyers[1].id])
+
+    def test_other_users_job_not_visible(self):
+        other = User.objects.create_user(username="other", password="password123")
+        job = CheckoutJob.objects.create(user=other)
+        response = self.client.get(reverse("checkout-job", args=[job.id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class OrderHistoryViewTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username=f"testuser_{uuid.uuid4().hex[:8]}",
+            email=f"test_{uuid.uuid4().hex[:8]}@example.com",
+            password="password123",
+        )
+        self.product = Product.objects.create(
+            name="Test Product", price=Decimal("10.00"), stock=5
+        )
+        self.product2 = Product.objects.create(
+            name="Test Product 2", price=Decimal("15.00"), stock=3
+        )
+        response = self.client.post(
+            "/api/user/token/",
+            {"username": self.user.username, "password": "password123"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK, msg=response.content)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + response.data["access"])
+
+    def create_orders(self, count, user=None):
+        orders = []
+        for _ in range(count):
+            order = Order.objects.create(user=user or self.user, total=Decimal("25.00"))
+            OrderItem.objects.create(
+                order=order, product=self.product, quantity=1, price=Decimal("10.00")
+            )
+            OrderItem.objects.create(
+                order=order, product=self.product2, quantity=1, price=Decimal("15.00")
+            )
+            orders.append(order)
+        return orders
+
+    def test_list_newest_first(self):
+        orders = self.create_orders(3)
+        self.create_orders(1, user=User.objects.create_user(username="other", password="x"))
+
+        response = self.client.get(reverse("order-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [order["id"] for order in response.data["results"]],
+            [order.id for order in reversed(orders)],
+        )
+        self.assertEqual(len(response.data["results"][0]["items"]), 2)
+
+    def test_list_query_count_is_fixed(self):
+        self.create_orders(2)
+        with self.assertNumQueries(6):
+            self.client.get(reverse("order-list"))
+        self.create_orders(15)
+        with self.assertNumQueries(6):
+            self.client.get(reverse("order-list"))
+        with self.assertNumQueries(2):
+            self.client.get(reverse("order-list"))
+
+    def test_cursor_pagination(self):
+        orders = self.create_orders(5)
+        response = self.client.get(reverse("order-list"), {"page_size": 2})
+        seen = [order["id"] for order in response.data["results"]]
+        while response.data["next"]:
+            response = self.client.get(response.data["next"])
+            seen += [order["id"] for order in response.data["results"]]
+        self.assertEqual(seen, [order.id for order in reversed(orders)])
+
+    def test_detail(self):
+        order = self.create_orders(1)[0]
+        response = self.client.get(reverse("order-detail", args=[order.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["total"], "25.00")
+
+    def test_sparse_fieldset_applies_to_cached_orders(self):
+        order = self.create_orders(1)[0]
+        self.client.get(reverse("order-list"))
+        response = self.client.get(
+            reverse("order-list"), {"fields": "id,items.quantity,items.product.name"}
+        )
+        self.assertEqual(
+            response.data["results"],
+            [{
+                "id": order.id,
+                "items": [
+                    {"quantity": 1, "product": {"name": "Test Product"}},
+                    {"quantity": 1, "product": {"name": "Test Product 2"}},
+                ],
+            }],
+        )
+        response = self.client.get(
+            reverse("order-detail", args=[order.id]), {"omit": "items,user"}
+        )
+        self.assertEqual(set(response.data), {"id", "created_at", "total"})
+
+    def test_detail_of_other_user_is_hidden(self):
+        other = User.objects.create_user(username="other", password="x")
+        order = self.create_orders(1, user=other)[0]
+        response = self.client.get(reverse("order-detail", args=[order.id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_unauthenticated(self):
+        self.client.credentials()
+        response = self.client.get(reverse("order-list"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class OrderRepresentationCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username=f"testuser_{uuid.uuid4().hex[:8]}",
+            email=f"test_{uuid.uuid4().hex[:8]}@example.com",
+            password="password123",
+        )
+        self.product = Product.objects.create(
+            name="Test Product", price=Decimal("10.00"), stock=5
+        )
+        self.product2 = Product.objects.create(
+            name="Test Product 2", price=Decimal("15.00"), stock=3
+        )
+        response = self.client.post(
+            "/api/user/token/",
+            {"username": self.user.username, "password": "password123"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK, msg=response.content)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + response.data["access"])
+
+    def create_orders(self, count, user=None):
+        orders = []
+        for _ in range(count):
+            order = Order.objects.create(user=user or self.user, total=Decimal("25.00"))
+            OrderItem.objects.create(
+                order=order, product=self.product, quantity=1, price=Decimal("10.00")
+            )
+            OrderItem.objects.create(
+                order=order, product=self.product2, quantity=1, price=Decimal("15.00")
+            )
+            orders.append(order)
+        return orders
+
+    def test_detail_served_from_cache_with_immutable_etag(self):
+        order = self.create_orders(1)[0]
+        url = reverse("order-detail", args=[order.id])
+        first = self.client.get(url)
+        self.assertEqual(first["Cache-Control"], "private, max-age=31536000, immutable")
+
+        with self.assertNumQueries(1):
+            second = self.client.get(url)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second["ETag"], first["ETag"])
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], first["ETag"])
+
+    def test_created_order_snapshot_is_served(self):
+        CartItem.objects.create(user=self.user, product=self.product, quantity=2)
+        self.user.balance = Decimal("100.00")
+        self.user.save()
+        created = self.client.post(reverse("create-order"))
+        Product.objects.filter(pk=self.product.pk).update(name="Renamed", stock=0)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("order-detail", args=[created.data["id"]]))
+        self.assertEqual(response.data, created.data)
+        self.assertEqual(response.data["items"][0]["product"]["name"], "Test Product")
+        self.assertEqual(response.data["items"][0]["product"]["stock"], 3)
+
+    def test_snapshot_outlives_the_cache(self):
+        order = self.create_orders(1)[0]
+        url = reverse("order-detail", args=[order.id])
+        first = self.client.get(url)
+        Product.objects.filter(pk=self.product.pk).update(name="Renamed", price=Decimal("99.00"))
+        cache.clear()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(url)
+        self.assertEqual(response.data, first.data)
+        self.assertEqual(response.data["items"][0]["product"]["name"], "Test Product")
+
+    def test_cached_order_of_other_user_is_hidden(self):
+        other = User.objects.create_user(username="other", password="x")
+        order = self.create_orders(1, user=other)[0]
+        render_order(order)
+        response = self.client.get(reverse("order-detail", args=[order.id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_list_revalidates_with_etag(self):
+        self.create_orders(2)
+        first = self.client.get(reverse("order-list"))
+        self.assertEqual(first["Cache-Control"], "private, no-cache")
+        response = self.client.get(reverse("order-list"), HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.create_orders(1)
+        response = self.client.get(reverse("order-list"), HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 3)
+
+    def test_deleting_order_drops_cached_copy(self):
+        order = self.create_orders(1)[0]
+        url = reverse("order-detail", args=[order.id])
+        self.client.get(url)
+        order.delete()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class OrderPartitionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username=f"testuser_{uuid.uuid4().hex[:8]}",
+            email=f"test_{uuid.uuid4().hex[:8]}@example.com",
+            password="password123",
+            balance=Decimal("100.00"),
+        )
+        self.product = Product.objects.create(
+            name="Test Product", price=Decimal("10.00"), stock=5
+        )
+
+    def test_month_arithmetic(self):
+        self.assertEqual(add_months(date(2025, 11, 1), 3), date(2026, 2, 1))
+        self.assertEqual(add_months(date(2025, 1, 1), -1), date(2024, 12, 1))
+        start, end = month_range(date(2025, 12, 1))
+        self.assertEqual(start.isoformat(), "2025-12-01T00:00:00+00:00")
+        self.assertEqual(end.isoformat(), "2026-01-01T00:00:00+00:00")
+        self.assertEqual(
+            partition_name("orders_order", date(2025, 2, 1)), "orders_order_p2025_02"
+        )
+
+    def test_items_share_order_timestamp(self):
+        CartItem.objects.create(user=self.user, product=self.product, quantity=1)
+        order = create_order_from_cart(self.user)
+        self.assertEqual(order.items.get().created_at, order.created_at)
+
+    def test_items_saved_one_by_one_share_order_timestamp(self):
+        order = Order.objects.create(user=self.user, total=Decimal("10.00"))
+        Order.objects.filter(pk=order.pk).update(
+            created_at=timezone.now() - timedelta(days=40)
+        )
+        order.refresh_from_db()
+        item = OrderItem.objects.create(
+            order=order, product=self.product, quantity=1, price=Decimal("10.00")
+        )
+        self.assertEqual(item.created_at, order.created_at)
+
+    @skipIf(connection.vendor == "postgresql", "orders are partitioned on PostgreSQL")
+    def test_commands_require_partitioned_tables(self):
+        for command, args in (
+            ("create_order_partitions", []),
+            ("archive_order_partitions", ["/tmp"]),
+        ):
+            with self.assertRaisesMessage(CommandError, "not partitioned"):
+                call_command(command, *args)
+
+    @skipUnless(connection.vendor == "postgresql", "partitioning needs PostgreSQL")
+    def test_create_partitions_command(self):
+        self.assertTrue(is_partitioned("orders_order"))
+        self.assertTrue(is_partitioned("orders_orderitem"))
+        out = StringIO()
+        call_command("create_order_partitions", "--months", "1", stdout=out)
+        month = add_months(month_start(timezone.now()), 1)
+        self.assertIn(f"{month:%Y-%m}", out.getvalue())
+        for table in PARTITIONED_TABLES:
+            self.assertIn(month, monthly_partitions(table))
+
+        order = Order.objects.create(user=self.user, total=Decimal("10.00"))
+        OrderItem.objects.create(
+            order=order, product=self.product, quantity=1, price=Decimal("10.00")
+        )
+        partition = partition_name("orders_orderitem", month_start(order.created_at))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT count(*) FROM {partition} WHERE order_id = %s", [order.id]
+            )
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+
+class OrderBatchCreateViewTests(APITestCase):
+    def setUp(self):
+        self.url = reverse("create-order-batch")
+        self.user = User.objects.create_user(
+            username=f"testuser_{uuid.uuid4().hex[:8]}",
+            email=f"test_{uuid.uuid4().hex[:8]}@example.com",
+            password="password123",
+            balance=Decimal("100.00"),
+        )
+        self.product = Product.objects.create(
+            name="Test Product", price=Decimal("10.00"), stock=5
+        )
+        self.other = Product.objects.create(
+            name="Other Product", price=Decimal("2.00"), stock=20
+        )
+        self.client.force_authenticate(self.user)
+
+    def post(self, *orders):
+        return self.client.post(
+            self.url,
+            {"orders": [
+                {"items": [{"product_id": pid, "quantity": qty} for pid, qty in order]}
+                for order in orders
+            ]},
+            format="json",
+        )
+
+    def test_creates_every_order(self):
+        response = self.post(
+            [(self.product.id, 2), (self.other.id, 1)],
+            [(self.product.id, 1), (self.product.id, 1)],
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        results = response.data["results"]
+        self.assertEqual([r["status"] for r in results], ["created", "created"])
+        self.assertEqual(results[0]["order"]["total"], "22.00")
+        self.assertEqual(results[1]["order"]["items"][0]["quantity"], 2)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 1)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal("58.00"))
+        self.assertEqual(Order.objects.filter(user=self.user).count(), 2)
+
+    def test_reports_failures_per_order(self):
+        User.objects.filter(pk=self.user.pk).update(balance=Decimal("70.00"))
+        response = self.post(
+            [(self.product.id, 4)],
+            [(self.product.id, 2)],
+            [(self.other.id, 20)],
+            [(999999, 1)],
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        results = response.data["results"]
+        self.assertEqual(
+            [r["status"] for r in results], ["created", "failed", "failed", "failed"]
+        )
+        self.assertEqual(results[1]["errors"]["detail"], "Insufficient stock")
+        self.assertEqual(int(results[1]["errors"]["products"][0]["available"]), 1)
+        self.assertIn("Insufficient balance", str(results[2]["errors"]["detail"]))
+        self.assertEqual(results[3]["errors"]["detail"], "No such product.")
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 1)
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.stock, 20)
+
+    def test_nothing_created_returns_400(self):
+        response = self.post([(self.product.id, 6)])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_query_count_does_not_grow_with_batch(self):
+        with self.assertNumQueries(11):
+            self.post(*[[(self.other.id, 1), (self.product.id, 1)]] * 5)
+        self.assertEqual(OrderItem.objects.count(), 10)
+
+    def test_invalid_payload(self):
+        response = self.client.post(self.url, {"orders": []}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.post([(self.product.id, 0)])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("orders", response.data)
+
+
+class OrderExportTests(APITestCase):
+    def setUp(self):
+        self.url = reverse("order-export")
+        self.user = User.objects.create_user(
+            username=f"testuser_{uuid.uuid4().hex[:8]}",
+            email=f"test_{uuid.uuid4().hex[:8]}@example.com",
+            password="password123",
+            is_staff=True,
+        )
+        self.product = Product.objects.create(
+            name="Test Product", price=Decimal("10.00"), stock=5
+        )
+        self.old = Order.objects.create(user=self.user, total=Decimal("20.00"))
+        self.new = Order.objects.create(user=self.user, total=Decimal("10.00"))
+        Order.objects.filter(pk=self.old.pk).update(created_at="2025-01-15T10:00:00Z")
+        Order.objects.filter(pk=self.new.pk).update(created_at="2025-03-01T08:00:00Z")
+        self.old.refresh_from_db()
+        self.new.refresh_from_db()
+        OrderItem.objects.create(
+            order=self.old, product=self.product, quantity=2, price=Decimal("10.00")
+        )
+        OrderItem.objects.create(
+            order=self.new, product=self.product, quantity=1, price=Decimal("10.00")
+        )
+        self.client.force_authenticate(self.user)
+
+    def content(self, response):
+        return b"".join(response.streaming_content).decode()
+
+    def test_csv_export(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        lines = self.content(response).splitlines()
+        self.assertEqual(
+            lines[0], "order_id,user_id,created_at,order_total,product_id,quantity,price"
+        )
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].startswith(f"{self.old.id},{self.user.id},2025-01-15"))
+
+    def test_ndjson_export_filters_dates(self):
+        response = self.client.get(
+            self.url, {"output": "ndjson", "date_from": "2025-01-01", "date_to": "2025-01-31"}
+        )
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["order_id"], self.old.id)
+        self.assertEqual(rows[0]["quantity"], 2)
+        self.assertEqual(rows[0]["order_total"], "20.00")
+
+    def test_requires_staff(self):
+        self.user.is_staff = False
+        self.user.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_invalid_range(self):
+        response = self.client.get(
+            self.url, {"date_from": "2025-02-01", "date_to": "2025-01-01"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_command_writes_to_stdout(self):
+        out = StringIO()
+        call_command("export_orders", "--output", "ndjson", "--from", "2025-02-01", stdout=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([row["order_id"] for row in rows], [self.new.id])
@@ -1,6 +1,18 @@
 from django.urls import path
-from .views import OrderCreateView
+from .views import (
+    CheckoutJobDetailView,
+    OrderBatchCreateView,
+    OrderCreateView,
+    OrderDetailView,
+    OrderExportView,
+    OrderListView,
+)
 
 urlpatterns = [
+    path("", OrderListView.as_view(), name="order-list"),
+    path("<int:pk>/", OrderDetailView.as_view(), name="order-detail"),
     path("create/", OrderCreateView.as_view(), name="create-order"),
-]
\ No newline at end of file
+    path("batch/", OrderBatchCreateView.as_view(), name="create-order-batch"),
+    path("export/", OrderExportView.as_view(), name="order-export"),
+    path("jobs/<int:pk>/", CheckoutJobDetailView.as_view(), name="checkout-job"),
+]
@@ -1,14 +1,150 @@
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.urls import reverse
 from rest_framework import generics, status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import NotFound
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
-from .services import create_order_from_cart
-from .serializers import OrderSerializer
+from idempotency.decorators import idempotent
+from store.fieldsets import filter_representation, requested_fieldsets
+from .cache import (
+    IMMUTABLE_CACHE_CONTROL,
+    REVALIDATE_CACHE_CONTROL,
+    conditional_response,
+    get_cached_order,
+    get_cached_orders,
+    render_order,
+    render_orders,
+)
+from .export import EXPORT_CONTENT_TYPES, stream_export
+from .models import CheckoutJob, Order
+from .pagination import OrderCursorPagination
+from .services import create_order_from_cart, create_orders_batch, enqueue_checkout
+from .serializers import (
+    CheckoutJobSerializer,
+    OrderBatchSerializer,
+    OrderExportSerializer,
+    OrderSerializer,
+)
 
 class OrderCreateView(generics.GenericAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = OrderSerializer
 
+    @idempotent
     def post(self, request):
+        if settings.CHECKOUT_ASYNC:
+            job = enqueue_checkout(request.user)
+            return Response(
+                CheckoutJobSerializer(job).data,
+                status=status.HTTP_202_ACCEPTED,
+                headers={"Location": reverse("checkout-job", args=[job.id])},
+            )
         order = create_order_from_cart(request.user)
-        serializer = self.get_serializer(order)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(render_order(order), status=status.HTTP_201_CREATED)
+
+
+class OrderBatchCreateView(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = OrderBatchSerializer
+
+    @idempotent
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = create_orders_batch(
+            request.user, [entry["items"] for entry in serializer.validated_data["orders"]]
+        )
+
+        created = render_orders(
+            list(Order.objects.filter(id__in=[order.id for order, _ in results if order]))
+        )
+        data = [
+            {"status": "created", "order": created[order.id]}
+            if order else {"status": "failed", "errors": errors}
+            for order, errors in results
+        ]
+        return Response(
+            {"results": data},
+            status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST,
+        )
+
+
+class UserOrdersMixin:
+    permission_classes = [IsAuthenticated]
+    serializer_class = OrderSerializer
+
+    def get_queryset(self):
+        return Order.objects.filter(user=self.request.user)
+
+
+class OrderListView(UserOrdersMixin, generics.ListAPIView):
+    pagination_class = OrderCursorPagination
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(
+            Order.objects.filter(user=request.user).only("id", "created_at")
+        )
+        order_ids = [order.id for order in page]
+        orders = get_cached_orders(order_ids)
+        missing = [order_id for order_id in order_ids if order_id not in orders]
+        if missing:
+            orders.update(render_orders(list(self.get_queryset().filter(id__in=missing))))
+
+        # Cached payloads are complete; the requested fieldset is cut from them.
+        fieldsets = requested_fieldsets(request)
+        data = self.get_paginated_response(
+            [filter_representation(orders[order_id], *fieldsets) for order_id in order_ids]
+        ).data
+        return conditional_response(request, data, REVALIDATE_CACHE_CONTROL)
+
+
+class OrderDetailView(UserOrdersMixin, generics.RetrieveAPIView):
+    def retrieve(self, request, *args, **kwargs):
+        data = get_cached_order(kwargs["pk"])
+        if data is None:
+            data = render_order(self.get_object())
+        elif data["user"] != request.user.id:
+            raise NotFound()
+        data = filter_representation(data, *requested_fieldsets(request))
+        return conditional_response(request, data, IMMUTABLE_CACHE_CONTROL)
+
+
+class CheckoutJobDetailView(generics.RetrieveAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = CheckoutJobSerializer
+
+    def get_queryset(self):
+        return CheckoutJob.objects.filter(user=self.request.user).select_related("order")
+
+    def retrieve(self, request, *args, **kwargs):
+        job = self.get_object()
+        serializer = self.get_serializer(job)
+        names = list(serializer.fields)
+        # The order is served from its snapshot, as OrderDetailView serves it.
+        if serializer.fields.pop("order", None) is None:
+            return Response(serializer.data)
+        data = serializer.data
+        fields, omit = requested_fieldsets(request)
+        order = filter_representation(
+            None if job.order is None else render_order(job.order),
+            fields.get("order", {}),
+            omit.get("order", {}),
+        )
+        return Response({name: order if name == "order" else data[name] for name in names})
+
+
+class OrderExportView(generics.GenericAPIView):
+    permission_classes = [IsAdminUser]
+    serializer_class = OrderExportSerializer
+
+    def get(self, request):
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        response = StreamingHttpResponse(
+            stream_export(params["output"], params.get("date_from"), params.get("date_to")),
+            content_type=EXPORT_CONTENT_TYPES[params["output"]],
+        )
+        response["Content-Disposition"] = f'attachment; filename="orders.{params["output"]}"'
+        return response
@@ -1 +1,37 @@
+from django.conf import settings
 from django.contrib import admin
+
+from .inventory import available_stock, rebalance
+from .models import Product, StockShard
+
+
+class StockShardInline(admin.TabularInline):
+    model = StockShard
+    extra = 0
+    can_delete = False
+    readonly_fields = ("index", "stock")
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Product)
+class ProductAdmin(admin.ModelAdmin):
+    inlines = [StockShardInline]
+    list_display = ("id", "name", "price", "total_stock", "stock_shards")
+    readonly_fields = ("stock_shards",)
+    actions = ["enable_sharding", "disable_sharding"]
+
+    @admin.display(description="stock")
+    def total_stock(self, obj):
+        return available_stock(obj)
+
+    @admin.action(description="Shard stock of selected products")
+    def enable_sharding(self, request, queryset):
+        for product in queryset:
+            rebalance(product, product.stock_shards or settings.DEFAULT_STOCK_SHARDS)
+
+    @admin.action(description="Stop sharding stock of selected products")
+    def disable_sharding(self, request, queryset):
+        for product in queryset.exclude(stock_shards=0):
+            rebalance(product, 0)
@@ -0,0 +1,97 @@
+"""Server-side cache of catalog responses.
+
+Product list pages and details are cached under the catalog version, so one
+``bump_catalog_version`` (product saves and deletes, stock taken or returned)
+retires every cached response at once. A missing entry is rebuilt by a
+single request; concurrent requests for the same key wait up to
+CATALOG_REBUILD_WAIT seconds for it instead of all querying the database.
+
+A second version, ``get_product_version``, only moves when product details
+(prices, names) change and not with stock, for responses that show products
+but must stay valid while the stock moves (the cart ETags).
+
+The versions and the rebuild locks only work in a cache every process shares,
+so without SHARED_CACHE responses are rendered on each request.
+"""
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = "catalog-version"
+PRODUCT_VERSION_KEY = "product-version"
+POLL_INTERVAL = 0.05
+
+
+def _get(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def _bump(key=VERSION_KEY):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), None)
+
+
+def get_catalog_version():
+    return _get(VERSION_KEY)
+
+
+def get_product_version():
+    return _get(PRODUCT_VERSION_KEY)
+
+
+def bump_catalog_version():
+    # Bumped now so this request does not read its own stale entries, and
+    # again after commit in case another request cached the old rows meanwhile.
+    _bump()
+    transaction.on_commit(_bump)
+
+
+def bump_product_version():
+    transaction.on_commit(lambda: _bump(PRODUCT_VERSION_KEY))
+
+
+def _key(request, version):
+    params = urlencode(sorted(request.query_params.lists()), doseq=True)
+    url = f"{request.get_host()}{request.path}?{params}"
+    return f"catalog:{version}:{hashlib.sha256(url.encode()).hexdigest()}"
+
+
+def cached_catalog_data(request, render):
+    """Return the cached response data for ``request``, calling ``render``
+    to build it on a miss."""
+    if not settings.SHARED_CACHE:
+        return render()
+    key = _key(request, get_catalog_version())
+    data = cache.get(key)
+    if data is not None:
+        return data
+
+    lock = f"{key}:rebuild"
+    if cache.add(lock, True, settings.CATALOG_REBUILD_WAIT):
+        try:
+            data = render()
+            cache.set(key, data, settings.PRODUCT_CACHE_TTL)
+        finally:
+            cache.delete(lock)
+        return data
+
+    deadline = time.monotonic() + settings.CATALOG_REBUILD_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        found = cache.get_many([key, lock])
+        if key in found:
+            return found[key]
+        if lock not in found:
+            # The rebuild failed (e.g. 404 or invalid parameters).
+            break
+    return render()
@@ -0,0 +1,139 @@
+"""Stock bookkeeping for products whose stock is split across StockShard rows.
+
+A sharded product keeps ``Product.stock`` at 0 and its real stock in
+``Product.stock_shards`` StockShard counter rows, so concurrent decrements land
+on different rows instead of queueing behind one lock.
+"""
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Sum
+
+from .cache import bump_catalog_version
+from .models import Product, StockShard
+
+
+def _cache_key(product_id):
+    return f"stock-shards:{product_id}"
+
+
+def sharded_stock(product_id):
+    """Sum of the product's shards, cached for STOCK_SHARD_CACHE_TTL seconds."""
+    return cache.get_or_set(
+        _cache_key(product_id),
+        lambda: StockShard.objects.filter(product_id=product_id).aggregate(
+            total=Sum("stock")
+        )["total"] or 0,
+        settings.STOCK_SHARD_CACHE_TTL,
+    )
+
+
+def available_stock(product):
+    if product.stock_shards:
+        return sharded_stock(product.id)
+    return product.stock
+
+
+def take_sharded_stock(product_id, shard_count, quantity):
+    """Decrement ``quantity`` from the product's shards, returning False when
+    the shards do not hold enough in total. Must run inside a transaction."""
+    start = random.randrange(shard_count)
+    for offset in range(shard_count):
+        index = (start + offset) % shard_count
+        taken = StockShard.objects.filter(
+            product_id=product_id, index=index, stock__gte=quantity
+        ).update(stock=F("stock") - quantity)
+        if taken:
+            return True
+
+    # No single shard covers the quantity: drain several under lock.
+    shards = list(
+        StockShard.objects.filter(product_id=product_id)
+        .order_by("index")
+        .select_for_update()
+    )
+    if sum(shard.stock for shard in shards) < quantity:
+        return False
+    remaining = quantity
+    for shard in shards:
+        portion = min(shard.stock, remaining)
+        if portion:
+            shard.stock -= portion
+            shard.save(update_fields=["stock"])
+            remaining -= portion
+        if not remaining:
+            break
+    return True
+
+
+def return_sharded_stock(product_id, shard_count, quantity):
+    StockShard.objects.filter(
+        product_id=product_id, index=random.randrange(shard_count)
+    ).update(stock=F("stock") + quantity)
+
+
+def take_stock(product, quantity):
+    """Decrement ``quantity`` without locking the product row, returning False
+    when there is not enough stock."""
+    bump_catalog_version()
+    if product.stock_shards:
+        return take_sharded_stock(product.id, product.stock_shards, quantity)
+    return bool(
+        Product.objects.filter(pk=product.pk, stock__gte=quantity).update(
+            stock=F("stock") - quantity
+        )
+    )
+
+
+def return_stock(product, quantity):
+    bump_catalog_version()
+    if product.stock_shards:
+        return_sharded_stock(product.id, product.stock_shards, quantity)
+    else:
+        Product.objects.filter(pk=product.pk).update(stock=F("stock") + quantity)
+
+
+def _spread(total, shard_count):
+    base, extra = divmod(total, shard_count)
+    return [base + (1 if index < extra else 0) for index in range(shard_count)]
+
+
+@transaction.atomic
+def rebalance(product, shard_count=None):
+    """Spread the product's stock evenly over ``shard_count`` shards (its
+    current count by default). A count of 0 moves the stock back to
+    ``Product.stock`` and drops the shards."""
+    product = Product.objects.select_for_update().get(pk=product.pk)
+    shards = StockShard.objects.filter(product=product)
+    locked = list(shards.order_by("index").select_for_update())
+    total = product.stock + sum(shard.stock for shard in locked)
+    if shard_count is None:
+        shard_count = product.stock_shards
+
+    shards.delete()
+    if shard_count:
+        StockShard.objects.bulk_create([
+            StockShard(product=product, index=index, stock=stock)
+            for index, stock in enumerate(_spread(total, shard_count))
+        ])
+        product.stock = 0
+    else:
+        product.stock = total
+    product.stock_shards = shard_count
+    product.save(update_fields=["stock", "stock_shards"])
+    cache.delete(_cache_key(product.pk))
+    return product
+
+
+@transaction.atomic
+def set_stock(product, total):
+    """Replace the product's stock with ``total``, keeping its sharding."""
+    product = Product.objects.select_for_update().get(pk=product.pk)
+    product.stock = total
+    product.save(update_fields=["stock"])
+    if product.stock_shards:
+        StockShard.objects.filter(product=product).update(stock=0)
+        product = rebalance(product)
+    return product
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products.inventory import rebalance
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = "Spread the stock of sharded products evenly across their shards."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "product_ids", nargs="*", type=int,
+            help="Products to rebalance (default: every sharded product).",
+        )
+        parser.add_argument(
+            "--shards", type=int,
+            help="Change the number of shards; 0 turns sharding off.",
+        )
+
+    def handle(self, *args, **options):
+        shards = options["shards"]
+        if shards is not None and shards < 0:
+            raise CommandError("--shards must not be negative.")
+
+        products = Product.objects.order_by("id")
+        if options["product_ids"]:
+            products = products.filter(id__in=options["product_ids"])
+        else:
+            products = products.exclude(stock_shards=0)
+
+        for product in products:
+            product = rebalance(product, shards)
+            self.stdout.write(
+                f"Product #{product.id}: {product.stock_shards} shards."
+            )
@@ -0,0 +1,36 @@
+# Generated by Django 4.2 on 2026-10-17 00:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_product_product_stock_non_negative'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='stock_shards',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='StockShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField()),
+                ('stock', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='products.product')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='stockshard',
+            constraint=models.UniqueConstraint(fields=('product', 'index'), name='unique_stock_shard_index'),
+        ),
+        migrations.AddConstraint(
+            model_name='stockshard',
+            constraint=models.CheckConstraint(check=models.Q(('stock__gte', 0)), name='stock_shard_non_negative'),
+        ),
+    ]
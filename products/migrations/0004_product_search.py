@@ -0,0 +1,78 @@
+from django.db import migrations
+
+POSTGRES_FORWARD = [
+    """
+    ALTER TABLE products_product ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(name, '')), 'A')
+        || setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX products_product_search_idx ON products_product USING GIN (search_vector)",
+]
+POSTGRES_BACKWARD = [
+    "DROP INDEX products_product_search_idx",
+    "ALTER TABLE products_product DROP COLUMN search_vector",
+]
+
+# External content table: the index reads name/description from products_product.
+# Migrations that rebuild products_product on SQLite drop these triggers and
+# must recreate them.
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE products_product_fts USING fts5(
+        name, description, content='products_product', content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER products_product_fts_insert AFTER INSERT ON products_product BEGIN
+        INSERT INTO products_product_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER products_product_fts_delete AFTER DELETE ON products_product BEGIN
+        INSERT INTO products_product_fts(products_product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER products_product_fts_update AFTER UPDATE OF name, description
+    ON products_product BEGIN
+        INSERT INTO products_product_fts(products_product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO products_product_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    "INSERT INTO products_product_fts(products_product_fts) VALUES ('rebuild')",
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER products_product_fts_update",
+    "DROP TRIGGER products_product_fts_delete",
+    "DROP TRIGGER products_product_fts_insert",
+    "DROP TABLE products_product_fts",
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_stock_shards'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({"postgresql": POSTGRES_FORWARD, "sqlite": SQLITE_FORWARD}),
+            _run({"postgresql": POSTGRES_BACKWARD, "sqlite": SQLITE_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2 on 2026-10-17 01:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('stock__gt', 0), ('stock_shards__gt', 0), _connector='OR'), fields=['price', 'id'], name='product_in_stock_price_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2 on 2026-10-17 01:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_product_price_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('stock__gt', 0), ('stock_shards__gt', 0), _connector='OR'), fields=['name', 'id'], name='product_in_stock_name_idx'),
+        ),
+    ]
@@ -2,11 +2,82 @@ from django.db import models
 from decimal import Decimal
 
 
+# Sharded products keep `stock` at 0 and their units in StockShard rows, so
+# only products matching this can be in stock. The partial catalog indexes use
+# it as their condition.
+MAY_BE_IN_STOCK = models.Q(stock__gt=0) | models.Q(stock_shards__gt=0)
+
+
+class ProductQuerySet(models.QuerySet):
+    def in_stock(self):
+        # MAY_BE_IN_STOCK lets the partial indexes be used; the shard check
+        # then drops sharded products whose shards are all empty.
+        stocked_shards = StockShard.objects.filter(product=models.OuterRef("pk"), stock__gt=0)
+        return self.filter(MAY_BE_IN_STOCK).filter(
+            models.Q(stock__gt=0) | models.Exists(stocked_shards)
+        )
+
+    def priced_between(self, low=None, high=None):
+        if low is not None:
+            self = self.filter(price__gte=low)
+        if high is not None:
+            self = self.filter(price__lte=high)
+        return self
+
+
 class Product(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True, default="")
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
+    # Number of StockShard rows holding this product's stock; 0 keeps it in `stock`.
+    stock_shards = models.PositiveSmallIntegerField(default=0)
+
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(stock__gte=0), name="product_stock_non_negative"
+            ),
+        ]
+        # Price ranges and the price and name orderings of the catalog, with
+        # id as the cursor tie breaker; the partial indexes cover ?in_stock=true.
+        indexes = [
+            models.Index(fields=["price", "id"], name="product_price_id_idx"),
+            models.Index(
+                fields=["price", "id"],
+                condition=MAY_BE_IN_STOCK,
+                name="product_in_stock_price_idx",
+            ),
+            models.Index(fields=["name", "id"], name="product_name_id_idx"),
+            models.Index(
+                fields=["name", "id"],
+                condition=MAY_BE_IN_STOCK,
+                name="product_in_stock_name_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.name} (price: {self.price})"
+
+
+class StockShard(models.Model):
+    product = models.ForeignKey(
+        Product, related_name="shards", on_delete=models.CASCADE
+    )
+    index = models.PositiveSmallIntegerField()
+    stock = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "index"], name="unique_stock_shard_index"
+            ),
+            models.CheckConstraint(
+                check=models.Q(stock__gte=0), name="stock_shard_non_negative"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}#{self.index}: {self.stock}"
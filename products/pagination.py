@@ -0,0 +1,137 @@
+import json
+
+from django.db import connection
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, _reverse_ordering
+
+# Sort keys a client may ask for with ?ordering=; "-" sorts descending.
+ORDERING_FIELDS = ("id", "price", "name")
+
+
+def estimated_count(queryset):
+    """Row count of ``queryset`` taken from the planner's estimate on
+    PostgreSQL instead of running COUNT(*); exact elsewhere."""
+    if connection.vendor != "postgresql":
+        return queryset.count()
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class ProductCursorPagination(CursorPagination):
+    """Keyset pages of the catalog ordered by ``?ordering=`` (id by default,
+    relevance for searches).
+
+    DRF's cursor positions on the first sort key only and skips rows sharing
+    it with an offset. Here the cursor holds the whole ``(key, id)`` of the
+    row it stops at, and a page starts strictly after it, so ties never
+    need an offset.
+
+    ``?count=estimate`` adds an approximate total to the page.
+    """
+
+    ordering = ("id",)
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering_query_param = "ordering"
+
+    def get_ordering(self, request, queryset, view):
+        key = request.query_params.get(self.ordering_query_param, "")
+        field = key.removeprefix("-")
+        if field not in ORDERING_FIELDS:
+            # Search results come best match first.
+            if "rank" in queryset.query.annotations:
+                return ("-rank", "id")
+            return self.ordering
+        if field == "id":
+            return (key,)
+        # id breaks ties so that the order is stable across pages.
+        return (key, "-id" if key.startswith("-") else "id")
+
+    def _position(self, instance):
+        return json.dumps(
+            [str(getattr(instance, field.lstrip("-"))) for field in self.ordering]
+        )
+
+    def _after(self, position, reverse):
+        """Rows strictly after ``position`` in the (possibly reversed) ordering:
+        ``key > v OR (key = v AND id > pk)``, led by the ``key >= v`` bound that
+        an index on ``(key, id)`` can range-scan."""
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        after, tied = Q(), Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") != reverse else "gt"
+            after |= tied & Q(**{f"{name}__{lookup}": value})
+            tied &= Q(**{name: value})
+        name = self.ordering[0].lstrip("-")
+        lookup = "lte" if self.ordering[0].startswith("-") != reverse else "gte"
+        return Q(**{f"{name}__{lookup}": values[0]}) & after
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = (
+            estimated_count(queryset) if request.query_params.get("count") == "estimate" else None
+        )
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        queryset = queryset.order_by(
+            *(_reverse_ordering(self.ordering) if reverse else self.ordering)
+        )
+        if self.cursor is not None and self.cursor.position is not None:
+            queryset = queryset.filter(self._after(self.cursor.position, reverse))
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_following = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_following
+        else:
+            self.has_next, self.has_previous = has_following, self.cursor is not None
+        if not self.page:
+            self.has_next = self.has_previous = False
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=False, position=self._position(self.page[-1]))
+        )
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=True, position=self._position(self.page[0]))
+        )
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.count is not None:
+            response.data = {"count": self.count, **response.data}
+        return response
+
+    def get_paginated_response_schema(self, schema):
+        schema = super().get_paginated_response_schema(schema)
+        schema["properties"]["count"] = {"type": "integer", "example": 123}
+        return schema
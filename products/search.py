@@ -0,0 +1,55 @@
+"""Full-text search over product names and descriptions.
+
+PostgreSQL matches against the ``search_vector`` generated column (GIN
+indexed); SQLite, used locally and in tests, against the ``products_product_fts``
+FTS5 table kept in sync by triggers. Both are created by migration
+0004_product_search. Results carry a ``rank`` annotation, higher is better.
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+
+from .models import Product
+
+FTS_TABLE = "products_product_fts"
+SEARCH_CONFIG = "english"
+
+
+def _fts5_query(text):
+    # Quote every word so that FTS5 operators in the input are taken literally.
+    return " ".join(f'"{word}"' for word in re.findall(r"\w+", text))
+
+
+def search_products(queryset, text):
+    """Filter ``queryset`` to the products matching ``text``, with a ``rank``."""
+    table = Product._meta.db_table
+    if connection.vendor == "postgresql":
+        vector = RawSQL(f"{table}.search_vector", [], output_field=SearchVectorField())
+        query = SearchQuery(text, config=SEARCH_CONFIG, search_type="websearch")
+        return queryset.alias(search=vector).filter(search=query).annotate(
+            # ts_rank is a real; a double survives the cursor round trip exactly.
+            rank=Cast(SearchRank(vector, query), FloatField())
+        )
+
+    if connection.vendor == "sqlite":
+        match = _fts5_query(text)
+        if not match:
+            return queryset.none()
+        return queryset.filter(
+            id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match])
+        ).annotate(
+            rank=RawSQL(
+                f"SELECT -bm25({FTS_TABLE}, 2.0, 1.0) FROM {FTS_TABLE}"
+                f" WHERE {FTS_TABLE} MATCH %s AND rowid = {table}.id",
+                [match],
+                output_field=FloatField(),
+            )
+        )
+
+    return queryset.filter(Q(name__icontains=text) | Q(description__icontains=text)).annotate(
+        rank=Value(0.0, output_field=FloatField())
+    )
@@ -1,14 +1,29 @@
 from decimal import Decimal
 from rest_framework import serializers
 
+from products.inventory import available_stock, set_stock
 from products.models import Product
+from store.fieldsets import SparseFieldsetMixin
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ["id", "name", "description", "stock", "price"]
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if instance.stock_shards and "stock" in data:
+            data["stock"] = available_stock(instance)
+        return data
+
+    def update(self, instance, validated_data):
+        stock = validated_data.pop("stock", None) if instance.stock_shards else None
+        instance = super().update(instance, validated_data)
+        if stock is not None:
+            instance = set_stock(instance, stock)
+        return instance
+
     def validate_price(self, value):
         if value <= Decimal("0"):
             raise serializers.ValidationError("Price must be greater than 0.")
@@ -18,3 +33,16 @@ class ProductSerializer(serializers.ModelSerializer):
         if value < 0:
             raise serializers.ValidationError("Stock must be positive.")
         return value
+
+
+class ProductFilterSerializer(serializers.Serializer):
+    q = serializers.CharField(required=False, trim_whitespace=True, allow_blank=True)
+    price_min = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    price_max = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    in_stock = serializers.BooleanField(required=False, default=False)
+
+    def validate(self, attrs):
+        low, high = attrs.get("price_min"), attrs.get("price_max")
+        if low is not None and high is not None and low > high:
+            raise serializers.ValidationError("price_min must not be above price_max.")
+        return attrs
@@ -0,0 +1,14 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import bump_catalog_version, bump_product_version
+from .models import Product
+
+STOCK_FIELDS = {"stock", "stock_shards"}
+
+
+@receiver([post_save, post_delete], sender=Product)
+def retire_cached_catalog(sender, instance, update_fields=None, **kwargs):
+    bump_catalog_version()
+    if update_fields is None or not update_fields <= STOCK_FIELDS:
+        bump_product_version()
@@ -1,9 +1,24 @@
+import itertools
+import threading
 import uuid
+from unittest import skipUnless
 from decimal import Decimal
-from django.test import TestCase
-from rest_framework.test import APITestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
 from rest_framework import status
-from products.models import Product
+from rest_framework.exceptions import ValidationError
+from django.core.cache import cache
+from django.core.management import call_command
+from io import StringIO
+from cart.models import CartItem
+from orders.services import create_order_from_cart
+from products.cache import _key, cached_catalog_data, get_catalog_version
+from products.inventory import rebalance, sharded_stock, take_sharded_stock
+from products.models import Product, StockShard
+from products.pagination import ProductCursorPagination
 from products.serializers import ProductSerializer
 from users.models import User
 
@@ -84,6 +99,7 @@ class ProductSerializerTest(TestCase):
 
 class ProductListCreateViewTest(APITestCase):
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(
             username=f"testuser_{uuid.uuid4().hex[:8]}",
             email=f"test_{uuid.uuid4().hex[:8]}@example.com",
@@ -112,8 +128,91 @@ class ProductListCreateViewTest(APITestCase):
     def test_list_products_unauthenticated(self):
         response = self.client.get("/api/products/")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]["name"], "Test Product")
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["results"][0]["name"], "Test Product")
+
+    def test_list_sparse_fieldset_defers_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/products/", {"fields": "id,name"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data["results"][0], {"id": self.product.id, "name": "Test Product"}
+        )
+        self.assertNotIn("description", queries[-1]["sql"])
+
+    def test_list_omit_fields(self):
+        response = self.client.get("/api/products/", {"omit": "description,stock"})
+        self.assertEqual(set(response.data["results"][0]), {"id", "name", "price"})
+
+    def create_products(self, prices):
+        return [
+            Product.objects.create(name=f"Product {i}", price=Decimal(price), stock=1)
+            for i, price in enumerate(prices)
+        ]
+
+    def walk(self, params):
+        response = self.client.get("/api/products/", params)
+        seen = [product["id"] for product in response.data["results"]]
+        while response.data["next"]:
+            response = self.client.get(response.data["next"])
+            seen += [product["id"] for product in response.data["results"]]
+        return seen
+
+    def test_cursor_pagination_by_id(self):
+        products = [self.product] + self.create_products(["5.00", "1.00", "7.00", "3.00"])
+        self.assertEqual(self.walk({"page_size": 2}), [p.id for p in products])
+        self.assertEqual(
+            self.walk({"page_size": 2, "ordering": "-id"}), [p.id for p in reversed(products)]
+        )
+
+    def test_cursor_pagination_by_price(self):
+        cheap, dear, same = self.create_products(["1.00", "20.00", "10.00"])
+        self.assertEqual(
+            self.walk({"page_size": 1, "ordering": "price"}),
+            [cheap.id, self.product.id, same.id, dear.id],
+        )
+
+    def test_cursor_pagination_through_ties(self):
+        products = [self.product] + self.create_products(["10.00"] * 4)
+        with CaptureQueriesContext(connection) as queries:
+            forward = self.walk({"page_size": 2, "ordering": "-price"})
+        self.assertEqual(forward, sorted((p.id for p in products), reverse=True))
+        self.assertFalse(any("OFFSET" in query["sql"] for query in queries))
+
+        response = self.client.get("/api/products/", {"page_size": 2, "ordering": "price"})
+        response = self.client.get(response.data["next"])
+        response = self.client.get(response.data["next"])
+        response = self.client.get(response.data["previous"])
+        self.assertEqual(
+            [product["id"] for product in response.data["results"]],
+            [products[2].id, products[3].id],
+        )
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/api/products/", {"cursor": "cD1ub3Rqc29u"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_page_size_is_capped(self):
+        request = Request(APIRequestFactory().get("/api/products/", {"page_size": 10000}))
+        self.assertEqual(ProductCursorPagination().get_page_size(request), 100)
+
+    def test_page_query_count_is_flat(self):
+        self.create_products(["1.00"] * 120)
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/products/")
+        self.assertEqual(len(response.data["results"]), 50)
+        self.assertNotIn("count", response.data)
+
+    def test_estimated_count(self):
+        self.create_products(["1.00", "2.00"])
+        postgresql = connection.vendor == "postgresql"
+        if postgresql:
+            # The planner estimates from the table statistics, which only
+            # ANALYZE fills in; without them the estimate is not the row count.
+            with connection.cursor() as cursor:
+                cursor.execute(f"ANALYZE {Product._meta.db_table}")
+        response = self.client.get("/api/products/", {"count": "estimate"})
+        self.assertAlmostEqual(response.data["count"], 3, delta=2 if postgresql else 0)
 
     def test_create_product_admin(self):
         self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.admin_token)
@@ -128,6 +227,15 @@ class ProductListCreateViewTest(APITestCase):
         self.assertEqual(Product.objects.count(), 2)
         self.assertEqual(Product.objects.last().name, "New Product")
 
+    def test_create_with_sparse_fieldset(self):
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.admin_token)
+        data = {"name": "New Product", "price": "20.00", "stock": 50}
+        response = self.client.post("/api/products/?fields=id", data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(set(response.data), {"id"})
+        product = Product.objects.get(pk=response.data["id"])
+        self.assertEqual((product.name, product.stock), ("New Product", 50))
+
     def test_create_product_non_admin(self):
         response = self.client.post(
             "/api/user/token/",
@@ -158,8 +266,168 @@ class ProductListCreateViewTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
+class ProductSearchTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.kettle = Product.objects.create(
+            name="Electric kettle", description="Boils water fast", price=Decimal("30.00")
+        )
+        self.teapot = Product.objects.create(
+            name="Teapot", description="Ceramic pot, pairs with any kettle",
+            price=Decimal("20.00"),
+        )
+        Product.objects.create(name="Toaster", description="Two slots", price=Decimal("25.00"))
+
+    def search(self, query, **params):
+        response = self.client.get("/api/products/", {"q": query, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [product["id"] for product in response.data["results"]]
+
+    def test_name_matches_rank_first(self):
+        self.assertEqual(self.search("kettles"), [self.kettle.id, self.teapot.id])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.teapot.description = "Ceramic pot"
+        self.teapot.save()
+        self.kettle.delete()
+        self.assertEqual(self.search("kettle"), [])
+        self.assertEqual(self.search("ceramic"), [self.teapot.id])
+
+    def test_query_syntax_is_literal(self):
+        self.assertEqual(self.search('kettle" OR toaster*'), [])
+        self.assertEqual(self.search("!!"), [])
+
+    def test_search_pages_and_ordering(self):
+        self.assertEqual(self.search("kettle", page_size=1), [self.kettle.id])
+        self.assertEqual(self.search("kettle", ordering="price"), [self.teapot.id, self.kettle.id])
+        response = self.client.get("/api/products/", {"q": "kettle", "page_size": 1})
+        response = self.client.get(response.data["next"])
+        self.assertEqual([product["id"] for product in response.data["results"]], [self.teapot.id])
+
+    def test_search_pages_through_equal_ranks(self):
+        twins = [
+            Product.objects.create(name="Kettle", price=Decimal("10.00")) for _ in range(3)
+        ]
+        seen = []
+        response = self.client.get("/api/products/", {"q": "kettle", "page_size": 1})
+        while True:
+            seen += [product["id"] for product in response.data["results"]]
+            if not response.data["next"]:
+                break
+            response = self.client.get(response.data["next"])
+        self.assertEqual(
+            sorted(seen), sorted([self.kettle.id, self.teapot.id, *(t.id for t in twins)])
+        )
+
+
+class ProductFilterTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.cheap = Product.objects.create(name="Cheap", price=Decimal("5.00"), stock=3)
+        self.sold_out = Product.objects.create(name="Sold out", price=Decimal("15.00"), stock=0)
+        self.sharded = rebalance(
+            Product.objects.create(name="Sharded", price=Decimal("25.00"), stock=8), 4
+        )
+        self.drained = rebalance(
+            Product.objects.create(name="Drained", price=Decimal("30.00"), stock=0), 4
+        )
+        self.dear = Product.objects.create(name="Dear", price=Decimal("50.00"), stock=1)
+
+    def ids(self, **params):
+        response = self.client.get("/api/products/", params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, msg=response.content)
+        return [product["id"] for product in response.data["results"]]
+
+    def test_filters(self):
+        self.assertEqual(
+            self.ids(price_min="10", price_max="25"), [self.sold_out.id, self.sharded.id]
+        )
+        # A sharded product is in stock only while one of its shards is.
+        self.assertEqual(
+            self.ids(in_stock="true", ordering="-price"),
+            [self.dear.id, self.sharded.id, self.cheap.id],
+        )
+
+    def test_invalid_filters(self):
+        response = self.client.get("/api/products/", {"price_min": "30", "price_max": "10"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get("/api/products/", {"price_min": "cheap"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def catalog_queries(self):
+        """Yield the parameters and the SQL of the first two pages of every
+        filter and ordering combination the catalog accepts."""
+        for in_stock, prices, ordering, q in itertools.product(
+            ["false", "true"],
+            [{}, {"price_min": "10"}, {"price_min": "10", "price_max": "30"}],
+            ["", "id", "-id", "price", "-price", "name", "-name"],
+            ["", "dear"],
+        ):
+            params = {"in_stock": in_stock, "ordering": ordering, "page_size": 1, **prices}
+            if q:
+                params["q"] = q
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get("/api/products/", params)
+                if response.data["next"]:
+                    self.client.get(response.data["next"])
+            for query in queries:
+                yield params, query["sql"]
+
+    @staticmethod
+    def may_sort(params):
+        """Sorting is only acceptable over rows an index already picked out:
+        search matches, or a price range ordered by something other than
+        price, which no single index can both narrow and order."""
+        ordering = params["ordering"].removeprefix("-")
+        price_range = "price_min" in params and ordering != "price"
+        return "q" in params or price_range
+
+    @skipUnless(connection.vendor == "sqlite", "Checks SQLite query plans.")
+    def test_every_combination_uses_an_index(self):
+        for params, sql in self.catalog_queries():
+            with self.subTest(**params), connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                plan = [row[-1] for row in cursor.fetchall()]
+                # A scan must walk an index in the requested order (the
+                # rowid is the primary key) or be a full-text match.
+                by_id = params["ordering"].removeprefix("-") in ("", "id")
+                for step in plan:
+                    if step == "SCAN products_product" and by_id and "q" not in params:
+                        continue
+                    if step.startswith("SCAN "):
+                        self.assertRegex(step, "USING INDEX|VIRTUAL TABLE INDEX", msg=plan)
+                if not self.may_sort(params):
+                    self.assertNotIn("USE TEMP B-TREE FOR ORDER BY", plan)
+
+    @skipUnless(connection.vendor == "postgresql", "Checks PostgreSQL query plans.")
+    def test_every_combination_uses_an_index_on_postgresql(self):
+        def nodes(node):
+            yield node
+            for child in node.get("Plans", []):
+                yield from nodes(child)
+
+        with connection.cursor() as cursor:
+            # Statistics left by earlier tests would change the plans, so
+            # they are taken afresh. The test tables are tiny; make the
+            # planner show what it would do on a catalog too large to read
+            # in full, where only an index scan returns the rows in order.
+            for model in (Product, StockShard):
+                cursor.execute(f"ANALYZE {model._meta.db_table}")
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("SET LOCAL enable_bitmapscan = off")
+            for params, sql in self.catalog_queries():
+                with self.subTest(**params):
+                    cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+                    plan = list(nodes(cursor.fetchone()[0][0]["Plan"]))
+                    types = [node["Node Type"] for node in plan]
+                    self.assertNotIn("Seq Scan", types, msg=types)
+                    if not self.may_sort(params):
+                        self.assertNotIn("Sort", types, msg=types)
+
+
 class ProductDetailViewTest(APITestCase):
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(
             username=f"testuser_{uuid.uuid4().hex[:8]}",
             email=f"test_{uuid.uuid4().hex[:8]}@example.com",
@@ -207,6 +475,18 @@ class ProductDetailViewTest(APITestCase):
         self.assertEqual(self.product.price, Decimal("15.00"))
         self.assertEqual(self.product.stock, 200)
 
+    def test_partial_update_with_sparse_fieldset(self):
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.admin_token)
+        response = self.client.patch(
+            f"/api/products/{self.product.id}/?fields=id",
+            {"name": "Renamed"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"id": self.product.id})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.name, "Renamed")
+
     def test_update_product_non_admin(self):
         response = self.client.post(
             "/api/user/token/",
@@ -249,3 +529,148 @@ class ProductDetailViewTest(APITestCase):
         self.client.credentials()
         response = self.client.delete(f"/api/products/{self.product.id}/")
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(SHARED_CACHE=True)
+class ProductCacheTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="buyer", password="password123")
+        self.user.balance = Decimal("100.00")
+        self.user.save()
+        self.product = Product.objects.create(
+            name="Test Product", price=Decimal("10.00"), stock=10
+        )
+        self.url = f"/api/products/{self.product.id}/"
+
+    def test_repeated_reads_are_served_from_cache(self):
+        self.client.get("/api/products/", {"ordering": "price"})
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            self.client.get("/api/products/", {"ordering": "price"})
+            response = self.client.get(self.url)
+        self.assertEqual(response.data["name"], "Test Product")
+
+    def test_product_save_retires_cached_responses(self):
+        self.client.get(self.url)
+        self.product.name = "Renamed"
+        self.product.save()
+        self.assertEqual(self.client.get(self.url).data["name"], "Renamed")
+
+    def test_checkout_retires_cached_stock(self):
+        self.client.get(self.url)
+        CartItem.objects.create(user=self.user, product=self.product, quantity=3)
+        create_order_from_cart(self.user)
+        self.assertEqual(self.client.get(self.url).data["stock"], 7)
+
+    def test_concurrent_miss_waits_for_the_rebuild(self):
+        request = Request(APIRequestFactory().get(self.url))
+        key = _key(request, get_catalog_version())
+        cache.add(f"{key}:rebuild", True)
+        threading.Timer(0.1, cache.set, [key, {"name": "rebuilt"}]).start()
+
+        def render():
+            raise AssertionError("rendered twice")
+
+        self.assertEqual(cached_catalog_data(request, render), {"name": "rebuilt"})
+
+    def test_failed_rebuild_does_not_block_others(self):
+        request = Request(APIRequestFactory().get(self.url))
+        lock = f"{_key(request, get_catalog_version())}:rebuild"
+        cache.add(lock, True)
+        threading.Timer(0.1, cache.delete, [lock]).start()
+        self.assertEqual(cached_catalog_data(request, lambda: {"name": "own"}), {"name": "own"})
+
+    @override_settings(SHARED_CACHE=False)
+    def test_no_caching_without_shared_cache(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data["name"], "Test Product")
+
+
+class StockShardingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(
+            name="Hot Product", price=Decimal("10.00"), stock=10
+        )
+        self.user = User.objects.create_user(
+            username=f"testuser_{uuid.uuid4().hex[:8]}",
+            password="password123",
+            balance=Decimal("1000.00"),
+        )
+
+    def shard_stocks(self):
+        return list(
+            StockShard.objects.filter(product=self.product)
+            .order_by("index")
+            .values_list("stock", flat=True)
+        )
+
+    def test_rebalance_spreads_stock(self):
+        product = rebalance(self.product, 4)
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(product.stock_shards, 4)
+        self.assertEqual(self.shard_stocks(), [3, 3, 2, 2])
+
+        product = rebalance(product, 0)
+        self.assertEqual(product.stock, 10)
+        self.assertFalse(StockShard.objects.exists())
+
+    def test_serializer_reports_summed_stock(self):
+        product = rebalance(self.product, 3)
+        self.assertEqual(ProductSerializer(product).data["stock"], 10)
+
+    def test_serializer_update_reshards_stock(self):
+        product = rebalance(self.product, 2)
+        serializer = ProductSerializer(product, data={"stock": 7}, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+        self.assertEqual(self.shard_stocks(), [4, 3])
+
+    def test_take_falls_back_across_shards(self):
+        rebalance(self.product, 4)
+        self.assertTrue(take_sharded_stock(self.product.id, 4, 2))
+        self.assertTrue(take_sharded_stock(self.product.id, 4, 7))
+        self.assertEqual(sum(self.shard_stocks()), 1)
+        self.assertFalse(take_sharded_stock(self.product.id, 4, 2))
+        self.assertEqual(sum(self.shard_stocks()), 1)
+
+    def test_cart_add_checks_summed_stock(self):
+        rebalance(self.product, 4)
+        item = CartItem.objects.add(self.user, self.product.id, 10)
+        self.assertEqual(item.quantity, 10)
+
+    def test_checkout_takes_sharded_stock(self):
+        rebalance(self.product, 4)
+        plain = Product.objects.create(name="Plain", price=Decimal("1.00"), stock=5)
+        CartItem.objects.create(user=self.user, product=self.product, quantity=6)
+        CartItem.objects.create(user=self.user, product=plain, quantity=5)
+
+        order = create_order_from_cart(self.user)
+
+        self.assertEqual(order.total, Decimal("65.00"))
+        self.assertEqual(sum(self.shard_stocks()), 4)
+        plain.refresh_from_db()
+        self.assertEqual(plain.stock, 0)
+
+    def test_checkout_reports_sharded_shortfall(self):
+        rebalance(self.product, 4)
+        CartItem.objects.create(user=self.user, product=self.product, quantity=11)
+        with self.assertRaises(ValidationError) as ctx:
+            create_order_from_cart(self.user)
+        insuff_product = ctx.exception.detail["products"][0]
+        self.assertEqual(int(insuff_product["product_id"]), self.product.id)
+        self.assertEqual(int(insuff_product["available"]), 10)
+        self.assertEqual(sum(self.shard_stocks()), 10)
+
+    def test_rebalance_command(self):
+        rebalance(self.product, 2)
+        StockShard.objects.filter(product=self.product, index=0).update(stock=0)
+        cache.clear()
+        out = StringIO()
+        call_command("rebalance_stock_shards", shards=3, stdout=out)
+        self.assertIn(f"Product #{self.product.id}: 3 shards.", out.getvalue())
+        self.assertEqual(self.shard_stocks(), [2, 2, 1])
+        self.assertEqual(sharded_stock(self.product.id), 5)
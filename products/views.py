@@ -1,12 +1,45 @@
+from functools import partial
 from rest_framework import generics
+from rest_framework.response import Response
 from rest_framework.permissions import IsAdminUser, AllowAny
+from store.fieldsets import SparseQuerysetMixin
+from .cache import cached_catalog_data
 from .models import Product
-from .serializers import ProductSerializer
+from .pagination import ProductCursorPagination
+from .search import search_products
+from .serializers import ProductFilterSerializer, ProductSerializer
 
 
-class ProductListCreateView(generics.ListCreateAPIView):
+class CatalogCacheMixin:
+    """Serve GET responses from the catalog cache (products/cache.py)."""
+
+    def list(self, request, *args, **kwargs):
+        render = partial(super().list, request, *args, **kwargs)
+        return Response(cached_catalog_data(request, lambda: render().data))
+
+    def retrieve(self, request, *args, **kwargs):
+        render = partial(super().retrieve, request, *args, **kwargs)
+        return Response(cached_catalog_data(request, lambda: render().data))
+
+
+class ProductListCreateView(CatalogCacheMixin, SparseQuerysetMixin, generics.ListCreateAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    pagination_class = ProductCursorPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method != "GET":
+            return queryset
+        filters = ProductFilterSerializer(data=self.request.query_params)
+        filters.is_valid(raise_exception=True)
+        params = filters.validated_data
+        queryset = queryset.priced_between(params.get("price_min"), params.get("price_max"))
+        if params["in_stock"]:
+            queryset = queryset.in_stock()
+        if params.get("q"):
+            queryset = search_products(queryset, params["q"])
+        return queryset
 
     def get_permissions(self):
         if self.request.method == "GET":
@@ -14,7 +47,7 @@ class ProductListCreateView(generics.ListCreateAPIView):
         return [IsAdminUser()]
 
 
-class ProductDetailView(generics.RetrieveUpdateDestroyAPIView):
+class ProductDetailView(CatalogCacheMixin, SparseQuerysetMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
 
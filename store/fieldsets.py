@@ -0,0 +1,141 @@
+"""Sparse fieldsets: ``?fields=`` keeps and ``?omit=`` drops response fields.
+
+Both take comma separated names; dotted names reach into nested objects, e.g.
+``?fields=id,items.quantity,items.product.name`` or ``?omit=product.description``.
+Serializers using ``SparseFieldsetMixin`` drop the fields while being built
+(responses to writes are filtered instead),
+``deferred_columns`` turns what was dropped into ``QuerySet.defer()`` lookups,
+and ``filter_representation`` applies the same selection to payloads that were
+rendered earlier (cached orders).
+"""
+import hashlib
+
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_PARAM = "fields"
+OMIT_PARAM = "omit"
+
+
+def _parse(value):
+    tree = {}
+    for path in filter(None, (part.strip() for part in value.split(","))):
+        node = tree
+        for name in path.split("."):
+            node = node.setdefault(name, {})
+    return tree
+
+
+def requested_fieldsets(request):
+    """Return the ``(fields, omit)`` trees of the request, empty when absent."""
+    params = getattr(request, "query_params", request.GET)
+    return _parse(params.get(FIELDS_PARAM, "")), _parse(params.get(OMIT_PARAM, ""))
+
+
+def fieldset_suffix(request):
+    """A short tag identifying the request's selection, for cache keys/ETags."""
+    params = getattr(request, "query_params", request.GET)
+    selection = f"{params.get(FIELDS_PARAM, '')}|{params.get(OMIT_PARAM, '')}"
+    if selection == "|":
+        return ""
+    return "-" + hashlib.sha256(selection.encode()).hexdigest()[:12]
+
+
+def _selected(names, fields, omit):
+    """Yield ``(name, nested fields, nested omit)`` for the names to keep."""
+    for name in names:
+        if fields and name not in fields:
+            continue
+        if name in omit and not omit[name]:
+            continue
+        yield name, fields.get(name, {}), omit.get(name, {})
+
+
+def _nested(field):
+    if isinstance(field, serializers.ListSerializer):
+        field = field.child
+    return field if isinstance(field, serializers.Serializer) else None
+
+
+def prune_fields(serializer, fields, omit):
+    kept = {name: (sub_fields, sub_omit) for name, sub_fields, sub_omit in
+            _selected(list(serializer.fields), fields, omit)}
+    for name in list(serializer.fields):
+        if name not in kept:
+            serializer.fields.pop(name)
+            continue
+        nested = _nested(serializer.fields[name])
+        if nested is not None and any(kept[name]):
+            prune_fields(nested, *kept[name])
+
+
+def filter_representation(data, fields, omit):
+    if not fields and not omit:
+        return data
+    if isinstance(data, list):
+        return [filter_representation(item, fields, omit) for item in data]
+    if not isinstance(data, dict):
+        return data
+    return {
+        name: filter_representation(data[name], sub_fields, sub_omit)
+        for name, sub_fields, sub_omit in _selected(data, fields, omit)
+    }
+
+
+def deferred_columns(serializer, prefix=""):
+    """Return ``defer()`` lookups for the model columns behind the fields the
+    serializer dropped, following nested forward relations."""
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    meta = getattr(serializer, "Meta", None)
+    if meta is None or not isinstance(meta.fields, (list, tuple)):
+        return []
+
+    deferred = []
+    model_fields = {field.name: field for field in meta.model._meta.concrete_fields}
+    kept = serializer.fields
+    for name in meta.fields:
+        field = model_fields.get(name)
+        if field is None or field.primary_key:
+            continue
+        if name not in kept:
+            if not field.is_relation:
+                deferred.append(prefix + name)
+        elif field.is_relation and not field.many_to_many:
+            nested = kept[name]
+            if isinstance(nested, serializers.Serializer) and not isinstance(
+                nested, serializers.ListSerializer
+            ):
+                deferred.extend(deferred_columns(nested, f"{prefix}{name}__"))
+    return deferred
+
+
+class SparseFieldsetMixin:
+    """Drop the fields not selected by the request in the serializer context.
+
+    Reads drop them while the serializer is built. Writes validate and save
+    with every field and only leave them out of the response."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get("request")
+        if request is not None and request.method in SAFE_METHODS:
+            prune_fields(self, *requested_fieldsets(request))
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        request = self.context.get("request")
+        if request is None or request.method in SAFE_METHODS or self.parent is not None:
+            return data
+        return filter_representation(data, *requested_fieldsets(request))
+
+
+class SparseQuerysetMixin:
+    """Defer the columns of fields the request left out when reading."""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method != "GET":
+            return queryset
+        deferred = deferred_columns(self.get_serializer())
+        return queryset.defer(*deferred) if deferred else queryset
@@ -0,0 +1,79 @@
+"""Request-scoped identity map.
+
+``IdentityMapMiddleware`` gives every request its own map so that services
+and serializers share the model instances they load and each row is fetched
+at most once per request. Instances reflect the row as it was loaded; code
+that needs current, locked values upgrades them with ``IdentityMap.lock``.
+
+Outside a request ``current_identity_map()`` returns an empty throwaway map,
+so callers never have to check whether one is active.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current = ContextVar("identity_map", default=None)
+
+
+class IdentityMap:
+    def __init__(self):
+        self._objects = {}
+
+    def add(self, *objects):
+        for obj in objects:
+            self._objects[type(obj), obj.pk] = obj
+
+    def get(self, model, pk):
+        """Return the instance with ``pk``, raising ``model.DoesNotExist``."""
+        found = self.get_many(model, [pk])
+        if pk not in found:
+            raise model.DoesNotExist(f"{model.__name__} matching pk={pk} does not exist.")
+        return found[pk]
+
+    def get_many(self, model, pks):
+        """Return ``{pk: instance}`` for the ``pks`` that exist."""
+        found = {pk: self._objects[model, pk] for pk in pks if (model, pk) in self._objects}
+        missing = [pk for pk in pks if pk not in found]
+        if missing:
+            loaded = model._default_manager.in_bulk(missing)
+            self.add(*loaded.values())
+            found.update(loaded)
+        return found
+
+    def lock(self, model, pks):
+        """Reload the ``pks`` with SELECT ... FOR UPDATE, in primary key order,
+        and return ``{pk: instance}``. Must run inside a transaction."""
+        locked = {
+            obj.pk: obj
+            for obj in model._default_manager.filter(pk__in=pks)
+            .order_by("pk")
+            .select_for_update()
+        }
+        self.add(*locked.values())
+        return locked
+
+
+def current_identity_map():
+    return _current.get() or IdentityMap()
+
+
+@contextmanager
+def identity_map():
+    """Activate a fresh identity map for the block, or keep the active one.
+    Also usable as a decorator."""
+    if _current.get() is not None:
+        yield _current.get()
+        return
+    token = _current.set(IdentityMap())
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(token)
+
+
+class IdentityMapMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with identity_map():
+            return self.get_response(request)
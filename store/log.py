@@ -0,0 +1,76 @@
+"""Logging that never blocks the request thread on I/O.
+
+``QueueListenerHandler`` only puts records on an in-memory queue; a background
+``QueueListener`` thread hands them to the real handlers (console, rotating
+file), so a slow disk cannot stretch a checkout transaction.
+"""
+import copy
+import json
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+_RESERVED_ATTRS = set(
+    vars(logging.LogRecord("", logging.INFO, "", 0, "", (), None))
+) | {"message", "asctime", "taskName"}
+
+
+class _LogEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        try:
+            return super().default(o)
+        except TypeError:
+            return str(o)
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line; fields passed via ``extra=`` become keys."""
+
+    def format(self, record):
+        payload = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        payload.update(
+            (key, value) for key, value in vars(record).items()
+            if key not in _RESERVED_ATTRS
+        )
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, cls=_LogEncoder)
+
+
+class QueueListenerHandler(QueueHandler):
+    """Queue records for a listener thread that feeds ``handlers``.
+
+    ``handlers`` are ``cfg://handlers.<name>`` references; dictConfig sets up
+    handlers in name order, so the targets must sort before this handler.
+    """
+
+    def __init__(self, handlers, respect_handler_level=True):
+        super().__init__(SimpleQueue())
+        # ConvertingList only resolves cfg:// references on item access.
+        targets = [handlers[index] for index in range(len(handlers))]
+        self.listener = QueueListener(
+            self.queue, *targets, respect_handler_level=respect_handler_level
+        )
+        self.listener.start()
+
+    def prepare(self, record):
+        # The queue never leaves the process, so the record does not have to
+        # be made picklable; only resolve the message while args are current.
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        return record
+
+    def close(self):
+        # Called by logging.shutdown() at exit: drain the queue first.
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        super().close()
@@ -28,6 +28,7 @@ INSTALLED_APPS = [
     "products",
     "cart",
     "orders",
+    "idempotency",
 ]
 
 MIDDLEWARE = [
@@ -38,6 +39,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "store.identity.IdentityMapMiddleware",
 ]
 
 ROOT_URLCONF = "store.urls"
@@ -120,11 +122,93 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
 }
 
+# A cache shared by every web and worker process, e.g. redis://redis:6379/0.
+# Without CACHE_URL each process keeps its own in-memory cache, so the features
+# that keep state in the cache (cached carts, cart ETags, the catalog cache)
+# check SHARED_CACHE and stay off.
+CACHE_URL = os.getenv("CACHE_URL")
+if CACHE_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_URL,
+        }
+    }
+SHARED_CACHE = bool(CACHE_URL)
+
+# "locking" re-checks stock under SELECT ... FOR UPDATE, "optimistic" relies on
+# conditional UPDATEs and the non-negative CHECK constraints instead.
+CHECKOUT_STRATEGY = os.getenv("CHECKOUT_STRATEGY", "locking")
+
+# Queue checkouts for `manage.py checkout_worker` and answer 202 Accepted
+# instead of running them inside the web request.
+CHECKOUT_ASYNC = os.getenv("CHECKOUT_ASYNC") == "True"
+CHECKOUT_JOB_LEASE = timedelta(minutes=5)
+
+# Rendered orders are immutable; keep them in the cache for a week.
+ORDER_CACHE_TTL = 60 * 60 * 24 * 7
+
+# Live cart storage (cart/storage.py). With "cart.storage.CacheCartStorage"
+# carts live in the cache and are written to the database every
+# CART_FLUSH_INTERVAL seconds and before checkout; it needs SHARED_CACHE and
+# falls back to the database storage without it.
+CART_STORAGE = os.getenv("CART_STORAGE", "cart.storage.DatabaseCartStorage")
+CART_CACHE_TTL = 60 * 60 * 24 * 7
+CART_FLUSH_INTERVAL = 5
+
+# Anonymous users keep their cart in a signed cookie (cart/guest.py), folded
+# into their database cart when they obtain a token.
+GUEST_CART_COOKIE = "guest_cart"
+GUEST_CART_MAX_AGE = 60 * 60 * 24 * 30
+GUEST_CART_MAX_LINES = 50
+
+# Sharded stock counters (products/inventory.py): shard count used when an admin
+# enables sharding, and how long the summed stock of a product may be cached.
+DEFAULT_STOCK_SHARDS = 8
+STOCK_SHARD_CACHE_TTL = 2
+
+# Rendered catalog responses (products/cache.py), retired whenever a product
+# or its stock changes; a request may wait this long for another to rebuild one.
+PRODUCT_CACHE_TTL = 60 * 5
+CATALOG_REBUILD_WAIT = 2
+
+# Take stock when a product is put in the cart and hold it for the user until
+# checkout; `manage.py expire_reservations` returns holds older than the TTL.
+STOCK_RESERVATIONS = os.getenv("STOCK_RESERVATIONS") == "True"
+STOCK_RESERVATION_TTL = timedelta(minutes=15)
+
+# Deadlock / serialization failure retries, see store/transactions.py.
+TRANSACTION_RETRY_ATTEMPTS = int(os.getenv("TRANSACTION_RETRY_ATTEMPTS", "3"))
+TRANSACTION_RETRY_BASE_DELAY = 0.02
+TRANSACTION_RETRY_MAX_DELAY = 0.5
+
+# Stored responses for requests sent with an Idempotency-Key header are replayed
+# for this long, then removed by `manage.py purge_idempotency_keys`. A key whose
+# request is still unanswered after the lease is assumed abandoned and reused.
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+IDEMPOTENCY_KEY_LEASE = timedelta(minutes=2)
+
+# Records are queued by the "queue" handler and written by a background thread
+# (store/log.py); orders.log holds one JSON object per line.
 LOGGING = {
     "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "json": {"()": "store.log.JSONFormatter"},
+    },
     "handlers": {
         "console": {"class": "logging.StreamHandler"},
-        "file": {"class": "logging.FileHandler", "filename": "orders.log"},
+        "file": {
+            "class": "logging.handlers.RotatingFileHandler",
+            "filename": os.getenv("LOG_FILE", "orders.log"),
+            "maxBytes": 10 * 1024 * 1024,
+            "backupCount": 5,
+            "formatter": "json",
+        },
+        "queue": {
+            "()": "store.log.QueueListenerHandler",
+            "handlers": ["cfg://handlers.console", "cfg://handlers.file"],
+        },
     },
-    "root": {"handlers": ["console", "file"], "level": "INFO"},
+    "root": {"handlers": ["queue"], "level": "INFO"},
 }
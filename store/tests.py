@@ -0,0 +1,169 @@
+import io
+import json
+import logging
+from decimal import Decimal
+from unittest import mock
+
+from django.db import OperationalError, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from products.models import Product
+from store.identity import current_identity_map, identity_map
+from store.log import JSONFormatter, QueueListenerHandler
+from store.transactions import (
+    DEADLOCK_DETECTED,
+    SERIALIZATION_FAILURE,
+    reset_retry_metrics,
+    retry_metrics,
+    retry_on_conflict,
+)
+
+
+class FakeDriverError(Exception):
+    def __init__(self, pgcode):
+        super().__init__(pgcode)
+        self.pgcode = pgcode
+
+
+def db_error(pgcode):
+    exc = OperationalError(pgcode)
+    exc.__cause__ = FakeDriverError(pgcode)
+    return exc
+
+
+@override_settings(TRANSACTION_RETRY_ATTEMPTS=3)
+@mock.patch("store.transactions.time.sleep")
+class RetryOnConflictTest(SimpleTestCase):
+    def setUp(self):
+        reset_retry_metrics()
+
+    def test_retries_deadlock_then_succeeds(self, sleep):
+        outcomes = [db_error(DEADLOCK_DETECTED), db_error(SERIALIZATION_FAILURE), "ok"]
+
+        @retry_on_conflict
+        def checkout():
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        self.assertEqual(checkout(), "ok")
+        self.assertEqual(sleep.call_count, 2)
+        name = f"{checkout.__module__}.{checkout.__qualname__}"
+        self.assertEqual(retry_metrics(), {f"{name}.retries": 2})
+
+    def test_gives_up_after_budget(self, sleep):
+        calls = []
+
+        @retry_on_conflict
+        def checkout():
+            calls.append(1)
+            raise db_error(DEADLOCK_DETECTED)
+
+        with self.assertRaises(OperationalError):
+            checkout()
+        self.assertEqual(len(calls), 4)
+        name = f"{checkout.__module__}.{checkout.__qualname__}"
+        self.assertEqual(retry_metrics()[f"{name}.exhausted"], 1)
+
+    def test_other_errors_are_not_retried(self, sleep):
+        calls = []
+
+        @retry_on_conflict
+        def checkout():
+            calls.append(1)
+            raise OperationalError("connection refused")
+
+        with self.assertRaises(OperationalError):
+            checkout()
+        self.assertEqual(len(calls), 1)
+        sleep.assert_not_called()
+
+
+class RetryInsideAtomicTest(TestCase):
+    def test_no_retry_inside_outer_transaction(self):
+        calls = []
+
+        @retry_on_conflict
+        def checkout():
+            calls.append(1)
+            raise db_error(DEADLOCK_DETECTED)
+
+        with self.assertRaises(OperationalError):
+            checkout()
+        self.assertEqual(len(calls), 1)
+
+
+class JSONFormatterTest(SimpleTestCase):
+    def test_extra_fields_become_keys(self):
+        record = logging.LogRecord(
+            "orders.services", logging.INFO, __file__, 1, "Order %s", (7,), None
+        )
+        record.total = Decimal("12.50")
+        payload = json.loads(JSONFormatter().format(record))
+        self.assertEqual(payload["message"], "Order 7")
+        self.assertEqual(payload["level"], "INFO")
+        self.assertEqual(payload["total"], "12.50")
+        self.assertNotIn("args", payload)
+
+    def test_unserializable_extra_falls_back_to_str(self):
+        record = logging.LogRecord("django.request", logging.ERROR, __file__, 1, "x", (), None)
+        record.request = object()
+        payload = json.loads(JSONFormatter().format(record))
+        self.assertTrue(payload["request"].startswith("<object object"))
+
+
+class QueueListenerHandlerTest(SimpleTestCase):
+    def test_records_reach_targets_through_queue(self):
+        stream = io.StringIO()
+        target = logging.StreamHandler(stream)
+        handler = QueueListenerHandler([target])
+        logger = logging.getLogger("store.tests.queue")
+        logger.propagate = False
+        logger.addHandler(handler)
+        try:
+            logger.warning("queued %s", "record")
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+        self.assertEqual(stream.getvalue(), "queued record\n")
+
+
+class IdentityMapTest(TestCase):
+    def setUp(self):
+        self.products = [
+            Product.objects.create(name=f"Product {i}", price=Decimal("1.00"), stock=5)
+            for i in range(3)
+        ]
+
+    def test_rows_are_loaded_once(self):
+        with identity_map():
+            ids = [product.id for product in self.products]
+            with self.assertNumQueries(1):
+                first = current_identity_map().get_many(Product, ids[:2])
+            with self.assertNumQueries(1):
+                found = current_identity_map().get_many(Product, ids)
+            with self.assertNumQueries(0):
+                self.assertIs(current_identity_map().get(Product, ids[0]), first[ids[0]])
+            self.assertEqual(set(found), set(ids))
+
+    def test_missing_row_raises(self):
+        with identity_map(), self.assertRaises(Product.DoesNotExist):
+            current_identity_map().get(Product, 999)
+
+    def test_lock_reloads_rows(self):
+        with identity_map() as identity:
+            product = identity.get(Product, self.products[0].id)
+            Product.objects.filter(pk=product.pk).update(stock=1)
+            with transaction.atomic():
+                locked = identity.lock(Product, [product.pk])
+            self.assertEqual(locked[product.pk].stock, 1)
+            self.assertIs(identity.get(Product, product.pk), locked[product.pk])
+
+    def test_maps_do_not_outlive_their_scope(self):
+        with identity_map() as outer:
+            with identity_map() as inner:
+                self.assertIs(inner, outer)
+        with self.assertNumQueries(2):
+            current_identity_map().get(Product, self.products[0].id)
+            current_identity_map().get(Product, self.products[0].id)
@@ -0,0 +1,87 @@
+"""Retry of transactions aborted by deadlocks or serialization failures.
+
+Locking code paths acquire rows in one canonical order to keep deadlocks rare:
+the user's own cart items, then their stock reservations, then products
+(ordered by id, all of them before the first stock write), then the user.
+Whatever still slips through is retried by ``retry_on_conflict``.
+"""
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, connection
+
+logger = logging.getLogger(__name__)
+
+DEADLOCK_DETECTED = "40P01"
+SERIALIZATION_FAILURE = "40001"
+RETRYABLE_PGCODES = {DEADLOCK_DETECTED, SERIALIZATION_FAILURE}
+
+_metrics = Counter()
+_metrics_lock = threading.Lock()
+
+
+def is_retryable(exc):
+    return getattr(exc.__cause__, "pgcode", None) in RETRYABLE_PGCODES
+
+
+def retry_metrics():
+    """Return ``{"<function>.<event>": count}`` for retries and exhausted budgets."""
+    with _metrics_lock:
+        return dict(_metrics)
+
+
+def reset_retry_metrics():
+    with _metrics_lock:
+        _metrics.clear()
+
+
+def _record(name, event):
+    with _metrics_lock:
+        _metrics[f"{name}.{event}"] += 1
+
+
+def _backoff(attempt):
+    ceiling = min(
+        settings.TRANSACTION_RETRY_MAX_DELAY,
+        settings.TRANSACTION_RETRY_BASE_DELAY * 2 ** attempt,
+    )
+    return random.uniform(0, ceiling)
+
+
+def retry_on_conflict(func):
+    """Re-run ``func`` when its transaction is aborted by a deadlock or
+    serialization failure.
+
+    Must wrap the outermost ``transaction.atomic``: when called inside an
+    already open atomic block the error is re-raised immediately, because
+    only the owner of the transaction can roll it back and start over.
+    """
+    name = f"{func.__module__}.{func.__qualname__}"
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        attempts = settings.TRANSACTION_RETRY_ATTEMPTS
+        for attempt in range(attempts + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as exc:
+                if not is_retryable(exc) or connection.in_atomic_block:
+                    raise
+                if attempt == attempts:
+                    _record(name, "exhausted")
+                    logger.error("%s: retry budget exhausted after %s attempts", name, attempt + 1)
+                    raise
+                _record(name, "retries")
+                delay = _backoff(attempt)
+                logger.warning(
+                    "%s: %s, retrying in %.3fs (attempt %s/%s)",
+                    name, exc.__cause__.pgcode, delay, attempt + 1, attempts,
+                )
+                time.sleep(delay)
+
+    return wrapper
@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-17 00:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.CheckConstraint(check=models.Q(('balance__gte', 0)), name='user_balance_non_negative'),
+        ),
+    ]
@@ -9,5 +9,12 @@ class User(AbstractUser):
         max_digits=10, decimal_places=2, default=Decimal("0.00")
     )
 
+    class Meta(AbstractUser.Meta):
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(balance__gte=0), name="user_balance_non_negative"
+            ),
+        ]
+
     def __str__(self):
         return f"User: {self.username} email: {self.email}"
@@ -3,23 +3,24 @@ from rest_framework import serializers
 from django.contrib.auth.models import User
 from rest_framework.validators import UniqueValidator
 from .models import User
+from store.fieldsets import SparseFieldsetMixin
 from decimal import Decimal
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ["id", "username", "email", "balance"]
 
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ["id", "username", "email", "balance"]
         read_only_fields = ["id", "username", "email"]
 
 
-class RegisterSerializer(serializers.ModelSerializer):
+class RegisterSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, min_length=8)
     email = serializers.EmailField(
         validators=[UniqueValidator(queryset=User.objects.all())]
@@ -33,7 +34,7 @@ class RegisterSerializer(serializers.ModelSerializer):
         return User.objects.create_user(**validated_data)
 
 
-class ProfileSerializer(serializers.ModelSerializer):
+class ProfileSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
 
     class Meta:
@@ -150,6 +150,13 @@ class ProfileViewTest(APITestCase):
         self.assertEqual(response.data["username"], self.user.username)
         self.assertEqual(response.data["balance"], self.user.balance)
 
+    def test_sparse_fieldset(self):
+        response = self.client.get("/api/user/profile/", {"fields": "id,balance"})
+        self.assertEqual(response.data, {"id": self.user.id, "balance": "100.00"})
+        response = self.client.get("/api/user/profile/", {"omit": "email"})
+        self.assertNotIn("email", response.data)
+        self.assertIn("username", response.data)
+
     def test_unauthenticated(self):
         self.client.credentials()
         response = self.client.get(
@@ -182,6 +189,12 @@ class DepositViewTest(APITestCase):
         self.assertEqual(self.user.balance, Decimal("150.00"))
         self.assertEqual(response.data["balance"], "150.00")
 
+    def test_deposit_sparse_fieldset(self):
+        response = self.client.post(
+            "/api/user/balance/deposit/?fields=balance", {"amount": "50.00"}, format="json"
+        )
+        self.assertEqual(response.data, {"balance": "150.00"})
+
     def test_invalid_amount(self):
         data = {"amount": "-10.00"}
         response = self.client.post("/api/user/balance/deposit/", data, format="json")
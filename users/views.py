@@ -1,5 +1,10 @@
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.views import TokenObtainPairView
+from cart.guest import clear_guest_cart, read_guest_cart
+from cart.services import merge_guest_cart
+from idempotency.decorators import idempotent
 from .models import User
 from .serializers import (
     ProfileSerializer,
@@ -15,6 +20,25 @@ class RegisterView(generics.CreateAPIView):
     serializer_class = RegisterSerializer
 
 
+class TokenObtainView(TokenObtainPairView):
+    """Obtain a token pair and fold the guest cart cookie, if any, into the
+    user's cart."""
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        try:
+            serializer.is_valid(raise_exception=True)
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
+
+        response = Response(serializer.validated_data, status=status.HTTP_200_OK)
+        guest_cart = read_guest_cart(request)
+        if guest_cart:
+            merge_guest_cart(serializer.user, guest_cart)
+            clear_guest_cart(response)
+        return response
+
+
 class ProfileView(generics.RetrieveAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = UserProfileSerializer
@@ -27,6 +51,7 @@ class DepositView(generics.GenericAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = DepositSerializer
 
+    @idempotent
     def post(self, request):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -37,4 +62,7 @@ class DepositView(generics.GenericAPIView):
         user.save(update_fields=["balance"])
         user.refresh_from_db()
 
-        return Response(ProfileSerializer(user).data, status=status.HTTP_200_OK)
+        return Response(
+            ProfileSerializer(user, context=self.get_serializer_context()).data,
+            status=status.HTTP_200_OK,
+        )